@@ -38,6 +38,7 @@ import sys
 import tempfile
 
 from pathlib import Path
+from bpy.app.handlers import persistent
 from bpy.types import PropertyGroup
 
 from bpy.props import (
@@ -58,6 +59,8 @@ from . import (
     ui,
 )
 
+from .bake_operation import BakedImages
+
 
 def export_folder_name_update(self, context):
     if self.export_folder_name.startswith("//"):
@@ -165,6 +168,30 @@ class TextureBakeProperties(bpy.types.PropertyGroup):
         description = "Bake multiple objects to one set of textures. You must have more than one object selected for baking. You will need to manually make sure their UVs don't overlap",
     )
 
+    batch_bake: BoolProperty(
+        name = "Bake Objects Together",
+        default = False,
+        description = "Bake all objects in one render per texture map instead of rendering every object separately. This saves Cycles from rebuilding the scene for every object. Objects sharing the same mesh data are still baked separately",
+    )
+
+    prepare_materials_once: BoolProperty(
+        name = "Prepare Materials Once",
+        default = False,
+        description = "Duplicate and clean up the materials of every object once per bake instead of once per texture map. Between maps, only the bake image and the nodes that route the map into the emission shader are switched",
+    )
+
+    bake_linked_duplicates_once: BoolProperty(
+        name = "Bake Linked Duplicates Once",
+        default = False,
+        description = "Objects with the same mesh data, materials and modifiers are baked once and the others get copies of the textures. Ambient occlusion depends on the surroundings and is still baked for every object. Has no effect on merged bakes",
+    )
+
+    pack_scalar_bakes: BoolProperty(
+        name = "Pack Scalar Bakes",
+        default = False,
+        description = "Bake up to three grayscale maps like metalness and roughness into the color channels of a single image and split them up afterwards. This needs fewer renders per object",
+    )
+
     merged_bake_name: StringProperty(
         name = "Merge Name",
         description = "When baking one object at a time, the object's name is used in the texture name. Baking multiple objects to one texture set, however requires you to proivde a name for the textures",
@@ -195,6 +222,18 @@ class TextureBakeProperties(bpy.types.PropertyGroup):
         default = 1024,
     )
 
+    resample_filter: EnumProperty(
+        name = "Filter",
+        description = "The filter used to scale baked images to the output size",
+        default = 'LANCZOS3',
+        items = [
+            ('BOX', "Box", "Averages the covered pixels. Fast, but blocky when upscaling"),
+            ('TRIANGLE', "Triangle", "Bilinear filtering. Soft results"),
+            ('LANCZOS3', "Lanczos3", "Sharp results with slight ringing at hard edges"),
+            ('MITCHELL', "Mitchell", "A balance between sharpness and ringing"),
+        ],
+    )
+
     bake_32bit_float: BoolProperty(
         name = "32-bit Color Depth",
         description = "All images will be saved with full 32-bit floating-point color precision internally. This increases image quality at the cost of significantly higher memory usage and rendering time",
@@ -251,6 +290,12 @@ class TextureBakeProperties(bpy.types.PropertyGroup):
         description = "Bake to UDIMs. You must be exporting your bakes to use UDIMs. UDIM UVs have to be created manually",
     )
 
+    bake_udims_tiled: BoolProperty(
+        name = "Bake Tiles in One Pass",
+        description = "Bake all UDIM tiles at once into a tiled image instead of moving the UVs of every tile into the 0-1 range and baking tiles one by one",
+        default = False,
+    )
+
     udim_tiles: IntProperty(
         name = "UDIM Tiles",
         description = "Set the number of tiles that your UV map has used",
@@ -264,6 +309,12 @@ class TextureBakeProperties(bpy.types.PropertyGroup):
         update = export_textures_update,
     )
 
+    pipelined_export: BoolProperty(
+        name = "Export in Background",
+        description = "Write the textures of each object on background threads while the next object is baking. Only used for PNG and Targa textures with the built-in encoder, other textures are saved when the bake is done",
+        default = False,
+    )
+
     export_folder_per_object: BoolProperty(
         name = "Subfolder per object",
         description = "Create a subfolder for the textures of each baked object",
@@ -311,6 +362,20 @@ class TextureBakeProperties(bpy.types.PropertyGroup):
         ],
     )
 
+    bake_workers: IntProperty(
+        name = "Worker Processes",
+        description = "Split the objects to bake across this many background processes. Every process gets an equal share of the CPU threads. Merged bakes and bakes to a target object always use a single process",
+        default = 1,
+        min = 1,
+        soft_max = 16,
+    )
+
+    use_persistent_workers: BoolProperty(
+        name = "Keep Workers Running",
+        description = "Bake in background processes that stay alive for the whole session instead of starting a new process for every bake. This skips the startup time of Blender and the add-on for every bake after the first one",
+        default = False,
+    )
+
     batch_name: StringProperty(
         name = "Batch Name",
         description = "Name to apply to these bakes (is incorporated into the bakes file name, provided you have included this in the image format string - see addon preferences). NOTE: To maintain compatibility, only MS Windows acceptable characters will be used",
@@ -406,6 +471,26 @@ class TextureBakePackedTexture(PropertyGroup):
         update = export_texture_update,
     )
 
+    encoder: EnumProperty(
+        name = "Encoder",
+        description = "How PNG and Targa textures are written to disk",
+        default = 'BUILTIN',
+        items = [
+            ('BUILTIN', "Built-in", "Encode the texture directly on several threads"),
+            ('BLENDER', "Blender", "Save the texture with Blender's image writer"),
+        ],
+        update = export_texture_update,
+    )
+
+    compression: IntProperty(
+        name = "Compression",
+        description = "The zlib compression level of PNG textures. Higher levels give smaller files but take longer to save",
+        default = 6,
+        min = 0,
+        max = 9,
+        update = export_texture_update,
+    )
+
     red: PointerProperty(
         name = "R",
         description = "The texture's red channel",
@@ -552,6 +637,16 @@ class TextureBakePreferences(bpy.types.AddonPreferences):
                 else:
                     row.prop(texture, "file_format", text="")
 
+                if texture.file_format in ['PNG', 'TARGA']:
+                    row = col.split(factor=0.1)
+                    row.label(text="Encoder:")
+                    if texture.file_format == 'PNG':
+                        row = row.split(factor=0.7)
+                        row.prop(texture, "encoder", text="")
+                        row.prop(texture, "compression", text="")
+                    else:
+                        row.prop(texture, "encoder", text="")
+
                 col.separator()
                 row = col.split(factor=0.1)
                 row.label(text="Red:")
@@ -607,6 +702,7 @@ class TextureBakePreferences(bpy.types.AddonPreferences):
 classes = [
     operators.TEXTUREBAKE_OT_bake,
     operators.TEXTUREBAKE_OT_bake_input_textures,
+    operators.TEXTUREBAKE_OT_plan_bake,
     operators.TEXTUREBAKE_OT_reset_aliases,
     operators.TEXTUREBAKE_OT_bake_import,
     operators.TEXTUREBAKE_OT_bake_delete_individual,
@@ -652,9 +748,17 @@ classes = [
 ]
 
 
+@persistent
+def clear_file_caches(*args):
+    """Drops the references to datablocks of the blend file that is about to be
+    closed. Blender frees them without invalidating the Python objects"""
+    BakedImages.clear()
+
+
 def register():
     for cls in classes:
         bpy.utils.register_class(cls)
+    bpy.app.handlers.load_pre.append(clear_file_caches)
     bpy.types.Scene.TextureBake_Props = PointerProperty(type=TextureBakeProperties)
 
     prefs = bpy.context.preferences.addons[__package__].preferences
@@ -675,16 +779,17 @@ def unregister():
 
     bpy.ops.texture_bake.bake_delete()
     for p in bg_bake.background_bake_ops.bgops_list:
-        pid = p.process.pid
-        try:
-            os.kill(pid, signal.SIGKILL)
-        except:
-            pass
-        try:
-            os.remove(str(savepath / str(pid)) + '.blend')
-            os.remove(str(savepath / str(pid)) + '.blend1')
-        except:
-            pass
+        for job in p.jobs:
+            if not job.persistent:
+                try:
+                    os.kill(job.process.pid, signal.SIGKILL)
+                except:
+                    pass
+            bg_bake.remove_job_files(job.uid)
+    bg_bake.stop_persistent_workers()
+
+    if clear_file_caches in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(clear_file_caches)
 
     # User preferences
     del bpy.types.Scene.TextureBake_Props
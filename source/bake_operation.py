@@ -31,12 +31,17 @@ class BakeOperation:
         self.active_object = None
         self.sb_target_object = None
         self.bake_udims = False
+        self.bake_udims_tiled = False
+
+        # Mapping of mesh name to the UDIM tile currently moved into 0-1 UV space
+        self.udim_focus_tiles = {}
 
         # pbr stuff
         self.pbr_selected_bake_types = []
 
-        # Material id map stuff
-        self.mat_col_dict = {} #{matname, [r,g,b]
+    def shifts_udim_tiles(self):
+        """Whether UDIMs are baked one tile at a time by moving each tile into 0-1 UV space"""
+        return self.bake_udims and not self.bake_udims_tiled
 
     def assemble_pbr_bake_list(self):
         self.pbr_selected_bake_types = functions.get_maps_to_bake()
@@ -47,6 +52,16 @@ class MasterOperation:
 
     baked_textures = []
     prepared_mesh_objects = []
+    # Names of the objects whose export textures have already been packed
+    packed_objects = []
+    # The export preset compiled by post_processing.compile_pack_plan
+    pack_plan = None
+    # Duplicate materials that are reused for all maps, by object name. One
+    # (material, image node name, graph) per material slot
+    prepared_materials = {}
+    # The same duplicates by material fingerprint, and by object name unless
+    # all objects bake into the same images
+    prepared_duplicates = {}
 
     merged_bake = False
     merged_bake_name = ""
@@ -56,11 +71,77 @@ class MasterOperation:
         MasterOperation.bake_op = None
         MasterOperation.prepared_mesh_objects = []
         MasterOperation.baked_textures = []
+        MasterOperation.packed_objects = []
+        MasterOperation.pack_plan = None
+        MasterOperation.prepared_materials = {}
+        MasterOperation.prepared_duplicates = {}
         MasterOperation.merged_bake = False
         MasterOperation.merged_bake_name = ""
         MasterOperation.batch_name = ""
 
 
+class MaterialSwaps:
+    # Material slots switched to a duplicate for baking as (slot, original, duplicate),
+    # in the order the swaps were made
+    swaps = []
+    # Prepared duplicates by material fingerprint and bake image. Slots with
+    # identical materials share one duplicate until the originals are restored
+    duplicates = {}
+
+
 class BakeStatus:
     total_maps = 0
     current_map = 0
+    map_start_time = 0
+    map_method = "bake"
+
+
+class BakedImages:
+    """Index of the images tagged by bakes, by the object they were baked for.
+    Finding the image of a map doesn't need to scan all of bpy.data.images"""
+    by_object = {}
+    # Whether the index has been rebuilt since images were last loaded from elsewhere
+    rebuilt = False
+
+    def add(image):
+        images = BakedImages.by_object.setdefault(image["SB_objname"], [])
+        if image not in images:
+            images.append(image)
+
+    def remove(image):
+        """Has to be called before the image is removed from bpy.data"""
+        for images in BakedImages.by_object.values():
+            if image in images:
+                images.remove(image)
+
+    def rebuild():
+        BakedImages.by_object = {}
+        for img in bpy.data.images:
+            if "SB_objname" in img:
+                BakedImages.add(img)
+        BakedImages.rebuilt = True
+
+    def invalidate():
+        """Has to be called when tagged images are loaded, from background bakes for example"""
+        BakedImages.rebuilt = False
+
+    def clear():
+        """Forgets all images. Has to be called before another blend file is loaded,
+        which frees them without invalidating the references in the index"""
+        BakedImages.by_object = {}
+        BakedImages.rebuilt = False
+
+    def find(objname, **tags):
+        """Returns the images of an object whose SB_ tags have the given values,
+        sorted by name. Loaded images aren't known until the first lookup that
+        misses them, later misses don't scan the images again"""
+        def lookup():
+            images = [img for img in BakedImages.by_object.get(objname, []) if functions.is_valid(img)]
+            BakedImages.by_object[objname] = images
+            return [img for img in images if all(img.get(f"SB_{k}") == v for k, v in tags.items())]
+
+        results = lookup()
+        if not results and not BakedImages.rebuilt:
+            BakedImages.rebuild()
+            results = lookup()
+        return sorted(results, key=lambda img: img.name)
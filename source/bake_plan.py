@@ -0,0 +1,302 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import bpy
+import json
+from pathlib import Path
+
+from . import (
+    bakefunctions,
+    constants,
+    functions,
+    material_analysis,
+    post_processing,
+)
+
+
+class BakeTask:
+    def __init__(self, kind, bake_type, target, renders=1, seconds=0):
+        # One of "bake", "fill", "copy", "alias", "derive", "post_process" or "pack"
+        self.kind = kind
+        self.bake_type = bake_type
+        self.target = target
+        self.renders = renders
+        # None if there is no timing history for this kind of bake
+        self.seconds = seconds
+
+
+class BakePlan:
+    def __init__(self):
+        self.tasks = []
+        self.num_objects = 0
+        self.num_maps = 0
+        self.num_tiles = 1
+        self.peak_memory = 0
+        self.disk_size = 0
+        self.warnings = []
+
+    def count(self, kind):
+        """Returns the number of renders or operations of the given kind"""
+        return sum(task.renders for task in self.tasks if task.kind == kind)
+
+    def seconds(self):
+        """Returns the estimated wall time or None if some bakes have no timing history"""
+        if any(task.seconds is None for task in self.tasks):
+            return None
+        return sum(task.seconds for task in self.tasks)
+
+    def summary(self):
+        """Returns the plan as a list of human readable lines"""
+        lines = [
+            f"{self.num_objects} objects, {self.num_maps} maps, {self.num_tiles} UDIM tiles",
+            f"Bake renders: {self.count('bake')}",
+            f"Constant maps filled without baking: {self.count('fill')}",
+            f"Images copied without baking: {self.count('copy')}",
+            f"Maps copied to linked duplicates: {self.count('alias')}",
+            f"Maps derived from other maps: {self.count('derive')}",
+            f"Post-processing steps: {self.count('post_process')}",
+            f"Packed textures: {self.count('pack')}",
+            f"Peak image memory: {format_bytes(self.peak_memory)}",
+            f"Disk output: up to {format_bytes(self.disk_size)}",
+        ]
+
+        seconds = self.seconds()
+        if seconds is None:
+            lines.append("Estimated time: unknown, some maps have never been baked before")
+        else:
+            lines.append(f"Estimated time: {format_seconds(seconds)}")
+
+        return lines + [f"Warning: {w}" for w in self.warnings]
+
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def get_image_bytes(width, height, is_float):
+    """Returns the memory used by an RGBA image buffer"""
+    return width * height * 4 * (4 if is_float else 1)
+
+
+def get_timing_history_path():
+    # Same place as the bake presets
+    return Path(bpy.utils.script_path_user()).parents[1] / "data" / "TextureBake" / "timings.json"
+
+
+def load_timing_history():
+    """Returns the recorded bake times as a mapping of map name to total seconds and pixels"""
+    try:
+        with open(get_timing_history_path(), "r") as f:
+            return json.load(f)
+    except:
+        return {}
+
+
+def record_map_timings(events):
+    """Adds the map_finished events of a bake to the timing history"""
+    history = load_timing_history()
+    for event in events:
+        # Maps that were filled or copied say nothing about bake times
+        if event.get("method", "bake") != "bake":
+            continue
+
+        entry = history.setdefault(event["map"], {"seconds": 0, "pixels": 0})
+        entry["seconds"] += event["seconds"]
+        entry["pixels"] += event["width"] * event["height"] * event.get("tiles", 1)
+
+    try:
+        path = get_timing_history_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(history, f, indent=4)
+    except OSError as e:
+        functions.print_msg(f"Could not save bake timings: {e}")
+
+
+def estimate_seconds(history, bake_type, pixels):
+    """Estimates the time to bake a map from the recorded seconds per pixel"""
+    # Packed scalar bakes take about as long as the slowest of their maps
+    if isinstance(bake_type, tuple):
+        estimates = [estimate_seconds(history, m, pixels) for m in bake_type]
+        return None if None in estimates else max(estimates)
+
+    entry = history.get(bake_type)
+    if not entry or not entry["pixels"]:
+        return None
+    return entry["seconds"] / entry["pixels"] * pixels
+
+
+def get_plan_objects():
+    props = bpy.context.scene.TextureBake_Props
+    if props.use_object_list:
+        objects = functions.advanced_object_selection_to_list()
+    else:
+        objects = bpy.context.selected_objects
+    return [obj for obj in objects if obj and obj.type == "MESH"]
+
+
+def get_input_maps_to_bake():
+    props = bpy.context.scene.TextureBake_Props
+    maps = []
+    if props.selected_col_mats:
+        maps.append(constants.TEX_MAT_ID)
+    if props.selected_col_vertex:
+        maps.append(constants.TEX_VERT_COLOR)
+    if props.selected_thickness:
+        maps.append(constants.TEX_THICKNESS)
+    if props.selected_ao:
+        maps.append(constants.TEX_AO)
+    if props.selected_curvature:
+        maps.append(constants.TEX_CURVATURE)
+    return maps
+
+
+def get_post_process_maps():
+    """Returns the maps that are transformed after baking"""
+    maps = [constants.PBR_NORMAL_DX]
+    if bpy.context.scene.TextureBake_Props.rough_glossy_switch == "glossy":
+        maps.append(constants.PBR_ROUGHNESS)
+    return maps
+
+
+def get_preset_textures():
+    props = bpy.context.scene.TextureBake_Props
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    presets = [p for p in prefs.export_presets if p.uid == props.export_preset]
+    return post_processing.compile_pack_plan(presets[0]) if presets else []
+
+
+def create_bake_plan(input_maps=False):
+    """Works out what a bake with the current settings will do without baking
+    anything. Set input_maps to plan a bake of input textures instead of
+    export textures"""
+    props = bpy.context.scene.TextureBake_Props
+    history = load_timing_history()
+    plan = BakePlan()
+
+    objects = get_plan_objects()
+    plan.num_objects = len(objects)
+
+    in_pixels = props.input_width * props.input_height
+    plan.num_tiles = props.udim_tiles if props.bake_udims else 1
+    tiled = props.bake_udims and props.bake_udims_tiled
+    passes = 1 if tiled else plan.num_tiles
+
+    # The images a bake renders into, one per target
+    if props.selected_to_target and props.target_object:
+        targets = [(props.target_object.name, [props.target_object])]
+    elif props.merged_bake:
+        targets = [(props.merged_bake_name, objects)]
+    else:
+        targets = [(obj.name, [obj]) for obj in objects]
+
+    derived = []
+    if input_maps:
+        units = get_input_maps_to_bake()
+        plan.num_maps = len(units)
+    else:
+        maps = functions.get_maps_to_bake()
+        units = bakefunctions.get_bake_units(maps)
+        derived = bakefunctions.get_derived_maps(maps)
+        plan.num_maps = len(maps)
+
+    # Maps are filled or copied the same way do_bake decides it
+    analyse = not input_maps and not props.selected_to_target
+    instances = bakefunctions.get_bake_instances(objects) if analyse and not props.merged_bake else {}
+    for unit in units:
+        unit_targets = targets
+        if instances and unit not in bakefunctions.placement_dependent_maps:
+            unit_targets = [(name, objs) for name, objs in targets if name in instances]
+            maps = list(unit) if isinstance(unit, tuple) else [unit]
+            maps += [m for m in derived if post_processing.derived_maps[m] in maps]
+            for aliases in instances.values():
+                for obj in aliases:
+                    for m in maps:
+                        plan.tasks.append(BakeTask("alias", m, obj.name, plan.num_tiles))
+
+        baked = []
+        for name, target_objects in unit_targets:
+            if analyse and not tiled and material_analysis.get_objects_constant(target_objects, unit) is not None:
+                plan.tasks.append(BakeTask("fill", unit, name, plan.num_tiles))
+            elif analyse and not props.bake_udims and material_analysis.get_objects_image(target_objects, unit):
+                plan.tasks.append(BakeTask("copy", unit, name))
+            else:
+                baked.append((name, target_objects))
+
+        # Objects baked together only need one render per batch
+        if analyse and props.batch_bake and not props.merged_bake and baked:
+            batches = bakefunctions.get_bake_batches([objs[0] for _, objs in baked])
+            baked = [(", ".join(obj.name for obj in batch), batch) for batch in batches]
+
+        for name, target_objects in baked:
+            seconds = estimate_seconds(history, unit, in_pixels * plan.num_tiles)
+            plan.tasks.append(BakeTask("bake", unit, name, passes, seconds))
+
+    # Linked duplicates get copies of the derived maps as well
+    aliased = {obj.name for aliases in instances.values() for obj in aliases}
+    for m in derived:
+        for name, _ in targets:
+            if name not in aliased:
+                plan.tasks.append(BakeTask("derive", m, name, plan.num_tiles))
+
+    # Every bake image is split into per-map and per-tile images, which stay in memory
+    image_maps = [m for unit in units for m in (unit if isinstance(unit, tuple) else (unit,))] + derived
+    num_images = len(image_maps) * len(targets) * plan.num_tiles
+    out_width = max(props.input_width, props.output_width)
+    out_height = max(props.input_height, props.output_height)
+    image_bytes = get_image_bytes(out_width, out_height, props.bake_32bit_float)
+    plan.peak_memory = num_images * image_bytes
+
+    # Packed scalar bakes and tiled images need one temporary image on top
+    if tiled or any(isinstance(unit, tuple) for unit in units):
+        plan.peak_memory += image_bytes * (plan.num_tiles if tiled else 1)
+
+    for m in image_maps:
+        if m in get_post_process_maps():
+            for name, _ in targets:
+                plan.tasks.append(BakeTask("post_process", m, name, plan.num_tiles))
+
+    if not input_maps:
+        pack_targets = targets if not props.merged_bake else targets[:1]
+        out_pixels = props.output_width * props.output_height
+        for tex in get_preset_textures():
+            for name, _ in pack_targets:
+                plan.tasks.append(BakeTask("pack", tex.name, name))
+
+                # Packed textures are kept as float images
+                plan.peak_memory += get_image_bytes(props.output_width, props.output_height, True)
+
+                if props.export_textures:
+                    depth = 4 if tex.file_format == "OPEN_EXR" else int(tex.depth) // 8
+                    plan.disk_size += out_pixels * 4 * depth
+
+    if props.bake_32bit_float and image_bytes >= 1024 ** 3:
+        plan.warnings.append(f"Every 32-bit float image needs {format_bytes(image_bytes)} of memory")
+
+    return plan
@@ -20,20 +20,22 @@
 import bpy
 from . import functions
 import os
-import random
 import shutil
 import sys
 from pathlib import Path
 
 from. import (
+    bg_bake,
     constants,
+    material_analysis,
     post_processing,
 )
 
 from .bake_operation import (
+    BakedImages,
     BakeOperation,
     MasterOperation,
-    BakeStatus,
+    MaterialSwaps,
 )
 
 
@@ -94,6 +96,13 @@ def common_bake_prep():
 
     if props.use_object_list:
         current_bake_op.bake_objects = functions.advanced_object_selection_to_list()
+
+    # Processes in a worker pool only bake their share of the objects
+    worker_objects = bg_bake.get_worker_objects()
+    if worker_objects is not None:
+        current_bake_op.bake_objects = [obj for obj in current_bake_op.bake_objects if obj.name in worker_objects]
+        functions.print_msg(f"Baking {len(current_bake_op.bake_objects)} objects as part of a worker pool")
+
     if props.target_object != None:
         current_bake_op.sb_target_object = props.target_object
 
@@ -137,10 +146,18 @@ def common_bake_prep():
     if not bpy.context.preferences.addons["cycles"].preferences.has_active_device():
         bpy.context.scene.cycles.device = "CPU"
 
+    # Share the CPU fairly with the other processes of a worker pool
+    threads = bg_bake.get_worker_threads()
+    if threads:
+        functions.print_msg(f"Limiting render threads to {threads}")
+        bpy.context.scene.render.threads_mode = 'FIXED'
+        bpy.context.scene.render.threads = threads
+
     # Reset the UDIM counters to 0
     current_bake_op.bake_udims = props.bake_udims
+    current_bake_op.bake_udims_tiled = props.bake_udims and props.bake_udims_tiled
     current_bake_op.udim_counter = 1001
-    functions.currentUDIMtile = {}
+    current_bake_op.udim_focus_tiles = {}
 
     # If baking S2A, and the user has selected a cage object, there are extra steps to turn it on
     if props.selected_to_target:
@@ -166,159 +183,128 @@ def common_bake_prep():
 
 def do_post_processing(thisbake, IMGNAME):
     functions.print_msg("Doing post processing")
+    props = bpy.context.scene.TextureBake_Props
+
+    transforms = []
 
     # DirectX vs OpenGL normal map format
     if thisbake == constants.PBR_NORMAL_DX:
-        post_processing.post_process(
-            internal_img_name="SB_Temp_Img",
-            mode="1to1",
-            input_img=bpy.data.images[IMGNAME],
-            invert_g=True,
-        )
-
-        # Replace our existing image with the processed one
-        old = bpy.data.images[IMGNAME]
-        name = old.name
-        new = bpy.data.images["SB_Temp_Img"]
-        # Transfer tags
-        new["SB_objname"] = old["SB_objname"]
-        new["SB_batch"] = old["SB_batch"]
-        new["SB_globalmode"] = old["SB_globalmode"]
-        new["SB_thisbake"] = old["SB_thisbake"]
-        new["SB_merged_bake_name"] = old["SB_merged_bake_name"]
-        new["SB_udims"] = old["SB_udims"]
-
-        # Remove from the MasterOp baked list
-        MasterOperation.baked_textures.remove(old)
-        bpy.data.images.remove(old)
-        new.name = name
-
-        # Add to master list
-        MasterOperation.baked_textures.append(new)
+        transforms.append("invert_g")
 
     # Roughness vs Glossy
+    glossy = thisbake == constants.PBR_ROUGHNESS and props.rough_glossy_switch == "glossy"
+    if glossy:
+        transforms.append("invert_rgb")
+
+    if transforms:
+        post_processing.apply_pixel_transforms(bpy.data.images[IMGNAME], transforms)
+
+    if glossy:
+        rename_to_glossy(IMGNAME)
+
+
+def get_post_processed_tag(thisbake):
+    """Returns the SB_thisbake tag that the image of thisbake has after post-processing"""
     if thisbake == constants.PBR_ROUGHNESS and bpy.context.scene.TextureBake_Props.rough_glossy_switch == "glossy":
-        post_processing.post_process(
-            internal_img_name="SB_Temp_Img",
-            mode="1to1",
-            input_img=bpy.data.images[IMGNAME],
-            invert_all=True,
-        )
+        return "glossy"
+    return thisbake
 
-        # Replace our existing image with the processed one
-        old = bpy.data.images[IMGNAME]
-        name = old.name
-        new = bpy.data.images["SB_Temp_Img"]
-        # Transfer tags
-        new["SB_objname"] = old["SB_objname"]
-        new["SB_batch"] = old["SB_batch"]
-        new["SB_globalmode"] = old["SB_globalmode"]
-        # new["SB_thisbake"] = old["SB_thisbake"]
-        new["SB_merged_bake_name"] = old["SB_merged_bake_name"]
-        new["SB_udims"] = old["SB_udims"]
-
-        new["SB_thisbake"] = "glossy"
-
-        # Remove from the MasterOp baked list
-        MasterOperation.baked_textures.remove(old)
-        bpy.data.images.remove(old)
-        new.name = name
-
-        # Change roughness alias to glossy alias
-        prefs = bpy.context.preferences.addons[__package__].preferences
-        proposed_name = IMGNAME.replace(prefs.roughness_alias, prefs.glossy_alias)
-        if proposed_name in bpy.data.images:
-            bpy.data.images.remove(bpy.data.images[proposed_name])
 
-        bpy.data.images[IMGNAME].name = proposed_name
-        IMGNAME = proposed_name
+def rename_to_glossy(IMGNAME):
+    """Names and tags an inverted roughness image as a glossy map. Returns the new name"""
+    image = bpy.data.images[IMGNAME]
+    image["SB_thisbake"] = "glossy"
 
-        # Add to master list
-        MasterOperation.baked_textures.append(new)
+    # Change roughness alias to glossy alias
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    proposed_name = IMGNAME.replace(prefs.roughness_alias, prefs.glossy_alias)
+    if proposed_name != IMGNAME and proposed_name in bpy.data.images:
+        functions.remove_image(bpy.data.images[proposed_name])
 
+    image.name = proposed_name
+    return image.name
 
-def channel_packing(objects):
-    current_bake_op = MasterOperation.bake_op
+
+def get_export_folder(obj):
+    """Returns the folder that the packed textures of an object are saved to"""
     props = bpy.context.scene.TextureBake_Props
+    if props.export_folder_per_object and props.merged_bake:
+        return Path(str(functions.get_export_folder_name()) + "/" + props.merged_bake_name)
+    elif props.export_folder_per_object:
+        return Path(str(functions.get_export_folder_name()) + "/" + obj.name)
+    return Path(str(functions.get_export_folder_name()))
 
-    # Figure out the save folder for each object
-    efpo = props.export_folder_per_object
-    mb = props.merged_bake
-    mbn = props.merged_bake_name
 
-    obj_export_folder_names = {}
+def uses_pipelined_export():
+    """Whether objects are packed and exported as soon as all their maps are baked"""
+    props = bpy.context.scene.TextureBake_Props
+    return props.pipelined_export and props.export_textures and not props.merged_bake
 
-    for obj in objects:
-        if efpo and mb:
-            export_folder_name = Path(str(functions.get_export_folder_name()) + "/" + mbn)
-            obj_export_folder_names[obj.name] = export_folder_name
-        elif efpo:
-            export_folder_name = Path(str(functions.get_export_folder_name()) + "/" + obj.name)
-            obj_export_folder_names[obj.name] = export_folder_name
-        else:
-            export_folder_name = Path(str(functions.get_export_folder_name()))
-            obj_export_folder_names[obj.name] = export_folder_name
 
-    baked_textures = MasterOperation.baked_textures
-    prefs = bpy.context.preferences.addons[__package__].preferences
-    preset_id = props.export_preset
-    preset = ([p for p in prefs.export_presets if p.uid == preset_id])[0]
+def get_pack_plan():
+    """Returns the compiled textures of the selected export preset"""
+    if MasterOperation.pack_plan is None:
+        props = bpy.context.scene.TextureBake_Props
+        prefs = bpy.context.preferences.addons[__package__].preferences
+        preset = ([p for p in prefs.export_presets if p.uid == props.export_preset])[0]
+        MasterOperation.pack_plan = post_processing.compile_pack_plan(preset)
+    return MasterOperation.pack_plan
+
+
+def pack_object_textures(obj):
+    props = bpy.context.scene.TextureBake_Props
+    objname = obj.name
+    if props.merged_bake:
+        objname = props.merged_bake_name
+
+    if objname in MasterOperation.packed_objects:
+        return
+    MasterOperation.packed_objects.append(objname)
+
+    # Baked images of this object by map, the first image of a map wins
+    images = {}
+    tags = {"batch": MasterOperation.batch_name, "globalmode": MasterOperation.bake_op.bake_mode}
+    for img in BakedImages.find(objname, **tags):
+        images.setdefault(img["SB_thisbake"], img)
+
+    export_folder = get_export_folder(obj)
+
+    # Textures with the same channels share their pixels
+    pixels = {}
+    for tex in get_pack_plan():
+        key = tex.pixel_key()
+        if key not in pixels:
+            inputs = [images.get(info) if info != 'NONE' else None for info, _ in tex.channels]
+            for (info, _), img in zip(tex.channels, inputs):
+                if info != 'NONE' and not img:
+                    functions.print_error(f"No baked {info} map for {objname}, using a default value")
+            pixels[key] = post_processing.get_packed_pixels(inputs, [space for _, space in tex.channels], tex.alpha_convert)
+
+        # Create the texture
+        imgname = functions.gen_export_texture_name(tex.name, objname)
+        functions.print_msg(f"Creating packed texture {imgname} for object {objname} with format {tex.file_format}")
+
+        post_processing.pack_channels(
+            internal_img_name = imgname,
+            save = props.export_textures,
+            path_dir = export_folder,
+            path_filename = Path(imgname),
+            file_format = tex.file_format,
+            color_depth = tex.depth,
+            encoder = tex.encoder,
+            compression = tex.compression,
+            pixels = pixels[key],
+        )
+
+        functions.write_baked_texture(imgname)
 
+
+def channel_packing(objects):
+    """Packs the export textures of all objects that haven't been packed during the bake"""
     for obj in objects:
-        objname = obj.name
-        if props.merged_bake:
-            objname = props.merged_bake_name
-
-        for tex in preset.textures:
-            # Find the actual images that we need
-            red = None
-            if tex.red.info != 'NONE':
-                red = [img for img in baked_textures if img["SB_thisbake"] == tex.red.info and img["SB_objname"] == objname][0]
-
-            green = None
-            if tex.green.info != 'NONE':
-                green = [img for img in baked_textures if img["SB_thisbake"] == tex.green.info and img["SB_objname"] == objname][0]
-
-            blue = None
-            if tex.blue.info != 'NONE':
-                blue = [img for img in baked_textures if img["SB_thisbake"] == tex.blue.info and img["SB_objname"] == objname][0]
-
-            alpha = None
-            if tex.alpha.info != 'NONE':
-                alpha = [img for img in baked_textures if img["SB_thisbake"] == tex.alpha.info and img["SB_objname"] == objname][0]
-
-            # Determine transparency mode
-            alpha_convert = False
-            file_format = tex.file_format
-            if file_format == 'PNG' or file_format == 'TARGA':
-                alpha_convert = "premul"
-
-            # Create the texture
-            imgname = functions.gen_export_texture_name(tex.name, objname)
-            functions.print_msg(f"Creating packed texture {imgname} for object {objname} with format {file_format}")
-
-            post_processing.post_process(
-                internal_img_name = imgname,
-                mode = "3to1",
-                save = props.export_textures,
-                path_dir = obj_export_folder_names[obj.name],
-                path_filename = Path(imgname),
-                file_format = file_format,
-                color_depth = tex.depth,
-                input_r = red,
-                input_g = green,
-                input_b = blue,
-                input_a = alpha,
-                space_r = tex.red.space,
-                space_g = tex.green.space,
-                space_b = tex.blue.space,
-                space_a = tex.alpha.space,
-                alpha_convert = alpha_convert,
-            )
-
-            functions.write_baked_texture(imgname)
-
-        if props.merged_bake:
+        pack_object_textures(obj)
+
+        if bpy.context.scene.TextureBake_Props.merged_bake:
             break
 
 
@@ -326,8 +312,10 @@ def common_bake_finishing():
     # Run information
     current_bake_op = MasterOperation.bake_op
 
-    # Reset the UDIM focus tile of all objects
-    if current_bake_op.bake_mode in [constants.BAKE_MODE_S2A, constants.BAKE_MODE_INPUTS_S2A]:
+    # Reset the UDIM focus tile of all objects. Tiled bakes never move UVs
+    if current_bake_op.bake_udims_tiled:
+        pass
+    elif current_bake_op.bake_mode in [constants.BAKE_MODE_S2A, constants.BAKE_MODE_INPUTS_S2A]:
         # This was some kind of S2A bake
         functions.focus_UDIM_tile(current_bake_op.sb_target_object, 0)
     elif bpy.context.scene.TextureBake_Props.selected_to_target:
@@ -356,10 +344,10 @@ def common_bake_finishing():
             else:
                 name = obj.name.replace("_Baked", "")
 
-            image_list = [img for img in bpy.data.images \
-                if nametag in img and "SB_globalmode" in img and  \
-                img[nametag] == name and \
-                img["SB_globalmode"] in [constants.BAKE_MODE_INPUTS, constants.BAKE_MODE_INPUTS_S2A] ]
+            # Merged bakes tag their images with the merged name as object name as well
+            image_list = [img for img in BakedImages.find(name) \
+                if nametag in img and img[nametag] == name and \
+                img.get("SB_globalmode") in [constants.BAKE_MODE_INPUTS, constants.BAKE_MODE_INPUTS_S2A] ]
 
             print(image_list)
 
@@ -421,7 +409,7 @@ def specials_bake():
                     IMGNAME = IMGNAME+f".{udim_counter}"
 
                 # TODO - May want to change the tag when can apply specials bakes
-                functions.create_images(IMGNAME, special, bpy.context.scene.TextureBake_Props.merged_bake_name)
+                functions.create_images(IMGNAME, special, bpy.context.scene.TextureBake_Props.merged_bake_name, current_bake_op.bake_udims_tiled)
 
             for obj in objects:
                 OBJNAME = obj.name
@@ -435,7 +423,7 @@ def specials_bake():
                         IMGNAME = IMGNAME+f".{current_bake_op.udim_counter}"
 
                     # TODO - May want to change the tag when can apply specials bakes
-                    functions.create_images(IMGNAME, special, obj.name)
+                    functions.create_images(IMGNAME, special, obj.name, current_bake_op.bake_udims_tiled)
 
                 # Apply special material to all slots
                 materials = obj.material_slots
@@ -467,26 +455,27 @@ def specials_bake():
                 functions.select_only_this(obj)
                 functions.bake_operation("special", bpy.data.images[IMGNAME])
 
-                # Scale if needed
-                functions.scale_image_if_needed(bpy.data.images[IMGNAME])
-
                 # Update tracking
-                BakeStatus.current_map+=1
-                functions.print_msg(f"Bake maps {BakeStatus.current_map} of {BakeStatus.total_maps} complete")
-                functions.write_bake_progress(BakeStatus.current_map, BakeStatus.total_maps)
-                functions.write_baked_texture(IMGNAME)
+                functions.report_map_finished(special, IMGNAME)
+
+                # Scale if needed. Merged tiled images are still needed by the next object
+                if not (current_bake_op.bake_udims_tiled and bpy.context.scene.TextureBake_Props.merged_bake):
+                    finish_bake_image(special, IMGNAME, obj.name)
 
                 # Restore all materials
                 for matslot in materials:
                     if "_sbspectmp_" + special in matslot.name:
                         matslot.material = bpy.data.materials[matslot.name.replace("_sbspectmp_" + special, "")]
 
+            if current_bake_op.bake_udims_tiled and bpy.context.scene.TextureBake_Props.merged_bake:
+                finish_bake_image(special, IMGNAME, bpy.context.scene.TextureBake_Props.merged_bake_name)
+
     # Bake at least once
     specials_bake_actual()
     current_bake_op.udim_counter = current_bake_op.udim_counter + 1
 
     # If we are doing UDIMs, we need to go back in
-    if current_bake_op.bake_udims:
+    if current_bake_op.shifts_udim_tiles():
         while current_bake_op.udim_counter < bpy.context.scene.TextureBake_Props.udim_tiles + 1001:
             functions.print_msg(f"Going back in for tile {current_bake_op.udim_counter}")
             for obj in objects:
@@ -519,7 +508,7 @@ def col_id_map(input_width, input_height, objects, mode="random"):
             # UDIMs
             if current_bake_op.bake_udims:
                 IMGNAME = IMGNAME+f".{udim_counter}"
-            functions.create_images(IMGNAME, mode, bpy.context.scene.TextureBake_Props.merged_bake_name)
+            functions.create_images(IMGNAME, mode, bpy.context.scene.TextureBake_Props.merged_bake_name, current_bake_op.bake_udims_tiled)
 
         for obj in objects:
             OBJNAME = functions.trunc_if_needed(obj.name)
@@ -529,19 +518,11 @@ def col_id_map(input_width, input_height, objects, mode="random"):
                 IMGNAME = functions.gen_image_name(OBJNAME, mode)
                 if current_bake_op.bake_udims:
                     IMGNAME = IMGNAME+f".{udim_counter}"
-                functions.create_images(IMGNAME, mode, obj.name)
+                functions.create_images(IMGNAME, mode, obj.name, current_bake_op.bake_udims_tiled)
 
             for matslot in materials:
-                mat = bpy.data.materials.get(matslot.name)
-
                 # Duplicate material to work on it
-                functions.print_msg("Duplicating material")
-                mat["SB_originalmat"] = mat.name
-                dup = mat.copy()
-                dup["SB_dupmat"] = mat.name
-                matslot.material = dup
-                # We want to work on dup from now on
-                mat = dup
+                mat = functions.duplicate_material(matslot)
                 mat.use_nodes = True
 
                 nodetree = mat.node_tree
@@ -558,16 +539,7 @@ def col_id_map(input_width, input_height, objects, mode="random"):
                 nodetree.links.new(fromsocket, tosocket)
 
                 if mode == constants.TEX_MAT_ID:
-                    # Have we already generated a color for this mat?
-                    if mat.name in current_bake_op.mat_col_dict:
-                        col = current_bake_op.mat_col_dict[mat.name]
-                        emissnode.inputs["Color"].default_value = (col[0], col[1], col[2], 1.0)
-                    else:
-                        r = random.random()
-                        g = random.random()
-                        b = random.random()
-                        emissnode.inputs["Color"].default_value = (r, g, b, 1.0)
-                        current_bake_op.mat_col_dict[mat.name] = [r, g, b]
+                    emissnode.inputs["Color"].default_value = functions.get_material_id_color(mat)
                 else:
                     # Using vertex colors
                     # Get name of active vertex colors for this object
@@ -599,24 +571,25 @@ def col_id_map(input_width, input_height, objects, mode="random"):
             # Bake
             functions.bake_operation("Emission", bpy.data.images[IMGNAME])
 
-            # Scale if needed
-            functions.scale_image_if_needed(bpy.data.images[IMGNAME])
-
             # Update tracking
-            BakeStatus.current_map+=1
-            functions.print_msg(f"Bake maps {BakeStatus.current_map} of {BakeStatus.total_maps} complete")
-            functions.write_bake_progress(BakeStatus.current_map, BakeStatus.total_maps)
-            functions.write_baked_texture(IMGNAME)
+            functions.report_map_finished(mode, IMGNAME)
+
+            # Scale if needed. Merged tiled images are still needed by the next object
+            if not (current_bake_op.bake_udims_tiled and merged_bake):
+                finish_bake_image(mode, IMGNAME, obj.name)
 
             # Restore the original materials
             functions.restore_all_materials()
 
+        if current_bake_op.bake_udims_tiled and merged_bake:
+            finish_bake_image(mode, IMGNAME, bpy.context.scene.TextureBake_Props.merged_bake_name)
+
     # Bake at least once
     col_id_map_actual()
     udim_counter = udim_counter + 1
 
     # If we are doing UDIMs, we need to go back in
-    if current_bake_op.bake_udims:
+    if current_bake_op.shifts_udim_tiles():
 
         while udim_counter < bpy.context.scene.TextureBake_Props.udim_tiles + 1001:
             functions.print_msg(f"Going back in for tile {udim_counter}")
@@ -627,138 +600,552 @@ def col_id_map(input_width, input_height, objects, mode="random"):
             udim_counter = udim_counter + 1
 
     # Manually reset the UDIM tile. We don't run common finishing here, and we might end up going back to bake more specials
-    for obj in current_bake_op.bake_objects:
-        functions.focus_UDIM_tile(obj, 0)
+    if not current_bake_op.bake_udims_tiled:
+        for obj in current_bake_op.bake_objects:
+            functions.focus_UDIM_tile(obj, 0)
 
 
-def do_bake():
+def get_bake_batches(objects):
+    """Groups objects that can be baked in a single render. Objects sharing
+    mesh data also share material slots and can't bake to separate images
+    at the same time, so they end up in different batches"""
+    if not bpy.context.scene.TextureBake_Props.batch_bake:
+        return [[obj] for obj in objects]
+
+    batches = []
+    for obj in objects:
+        for batch in batches:
+            if obj.data not in [o.data for o in batch]:
+                batch.append(obj)
+                break
+        else:
+            batches.append([obj])
+
+    functions.print_msg(f"Baking {len(objects)} objects in {len(batches)} batches")
+    return batches
+
+
+# Maps that depend on the surroundings of an object. Linked duplicates bake them separately
+placement_dependent_maps = [constants.PBR_AO]
+
+
+def get_modifier_key(mod):
+    """Returns the settings of a modifier as a tuple, or None if the modifier
+    reads other objects and its result depends on where they are placed"""
+    values = [mod.type]
+    for prop in mod.bl_rna.properties:
+        if prop.identifier in ["rna_type", "name"] or prop.identifier.startswith("show_") or prop.type == "COLLECTION":
+            continue
+
+        value = getattr(mod, prop.identifier)
+        if prop.type == "POINTER":
+            if isinstance(value, bpy.types.Object):
+                return None
+            value = value.name if isinstance(value, bpy.types.ID) else None
+        elif prop.type == "ENUM" and prop.is_enum_flag:
+            value = tuple(sorted(value))
+        elif getattr(prop, "is_array", False):
+            value = tuple(value)
+        values.append(value)
+
+    # Geometry Nodes inputs are ID properties of the modifier
+    if mod.type == "NODES":
+        for key in sorted(mod.keys()):
+            value = mod[key]
+            if isinstance(value, (bpy.types.Object, bpy.types.Collection)):
+                return None
+
+            if isinstance(value, bpy.types.ID):
+                value = value.name_full
+            elif hasattr(value, "to_dict"):
+                value = repr(value.to_dict())
+            elif hasattr(value, "to_list"):
+                value = repr(value.to_list())
+            values.append((key, value))
+
+    return tuple(values)
+
+
+def get_object_bake_key(obj):
+    """Returns what the textures of an object depend on: its mesh data, its
+    materials and its modifiers. Objects with the same key bake the same
+    textures. Returns None for objects that have to be baked on their own"""
+    modifiers = []
+    for mod in obj.modifiers:
+        if not mod.show_render:
+            continue
+        key = get_modifier_key(mod)
+        if key is None:
+            return None
+        modifiers.append(key)
+
+    materials = tuple(slot.material.name if slot.material else "" for slot in obj.material_slots)
+    return (obj.data.as_pointer(), materials, tuple(modifiers))
+
+
+def get_bake_instances(objects):
+    """Groups linked duplicates that bake the same textures. Returns the names
+    of the objects that are baked, each with the list of objects that get
+    copies of its textures"""
+    props = bpy.context.scene.TextureBake_Props
+    if not props.bake_linked_duplicates_once or props.merged_bake:
+        return {obj.name: [] for obj in objects}
+
+    instances = {}
+    representatives = {}
+    for obj in objects:
+        key = get_object_bake_key(obj)
+        if key in representatives:
+            instances[representatives[key]].append(obj)
+            continue
+
+        instances[obj.name] = []
+        if key is not None:
+            representatives[key] = obj.name
+
+    num_aliases = sum(len(aliases) for aliases in instances.values())
+    if num_aliases:
+        functions.print_msg(f"{num_aliases} linked duplicates share the textures of other objects")
+    return instances
+
+
+def alias_baked_images(thisbake, objname, aliases):
+    """Gives linked duplicates copies of the images that were just baked and
+    post-processed for objname. The copies are named and tagged like images
+    baked for the duplicates themselves"""
     current_bake_op = MasterOperation.bake_op
+    maps = list(thisbake) if isinstance(thisbake, tuple) else [thisbake]
+    maps += [m for m in get_derived_maps(current_bake_op.pbr_selected_bake_types) if post_processing.derived_maps[m] in maps]
 
-    # Loop over the bake modes we are using
-    def do_bake_actual():
-        IMGNAME = ""
+    if current_bake_op.bake_udims_tiled:
+        tiles = [str(t) for t in range(1001, 1001 + bpy.context.scene.TextureBake_Props.udim_tiles)]
+    elif current_bake_op.bake_udims:
+        tiles = [str(current_bake_op.udim_counter)]
+    else:
+        tiles = [None]
+
+    for obj in aliases:
+        for m in maps:
+            # Post-processing may have renamed and retagged the images, glossy maps for example
+            tag = get_post_processed_tag(m)
+            sources = BakedImages.find(objname, thisbake=tag, batch=MasterOperation.batch_name,
+                globalmode=current_bake_op.bake_mode, udims=current_bake_op.bake_udims)
+            for i, tile in enumerate(tiles):
+                source = next((img for img in sources if tile is None or img.name.endswith(f".{tile}")), None)
+                if source is None:
+                    functions.print_error(f"No {tag} image of {objname} to copy to linked duplicate {obj.name}")
+                    continue
 
-        for thisbake in current_bake_op.pbr_selected_bake_types:
-            # If we are doing a merged bake, just create one image here
-            if(MasterOperation.merged_bake):
-                functions.print_msg("We are doing a merged bake")
-                IMGNAME = functions.gen_image_name(bpy.context.scene.TextureBake_Props.merged_bake_name, thisbake)
+                name = create_bake_image(obj.name, m, tile)
+                functions.report_map_started(m, name, "alias")
+                functions.print_msg(f"Copying {source.name} to linked duplicate {obj.name}")
 
-                # UDIM testing
-                if current_bake_op.bake_udims:
-                    IMGNAME = IMGNAME+f".{current_bake_op.udim_counter}"
+                functions.copy_image_pixels(source, name)
 
-                functions.create_images(IMGNAME, thisbake, bpy.context.scene.TextureBake_Props.merged_bake_name)
+                # The copy is already post-processed and only needs the same name and tag
+                if tag == "glossy":
+                    name = rename_to_glossy(name)
 
-            for obj in current_bake_op.bake_objects:
-                # Reset the already processed list
-                mats_done = []
+                # Tiled bakes count every map once, no matter how many tiles it has
+                if i == 0:
+                    functions.report_map_finished(m, name)
+                else:
+                    functions.write_baked_texture(name)
 
-                functions.print_msg(f"Baking object: {obj.name}")
 
-                # Truncate if needed from this point forward
-                OBJNAME = functions.trunc_if_needed(obj.name)
+def get_derived_maps(bake_types):
+    """Returns the bake types that are derived from another one of the given
+    bake types instead of baked"""
+    return [t for t in bake_types if post_processing.derived_maps.get(t) in bake_types]
 
-                # If we are not doing a merged bake
-                # Create the image we need for this bake (Delete if exists)
-                if(not MasterOperation.merged_bake):
-                    IMGNAME = functions.gen_image_name(obj.name, thisbake)
 
-                    # UDIM testing
-                    if current_bake_op.bake_udims:
-                        IMGNAME = IMGNAME+f".{current_bake_op.udim_counter}"
+def get_root_maps(bake_types):
+    """Returns the bake types that actually need to be baked"""
+    derived = get_derived_maps(bake_types)
+    return [t for t in bake_types if t not in derived]
 
-                    functions.create_images(IMGNAME, thisbake, obj.name)
 
-                # Prep the materials one by one
-                materials = obj.material_slots
-                for matslot in materials:
-                    mat = bpy.data.materials.get(matslot.name)
+def get_bake_units(bake_types):
+    """Returns the bakes needed for the given bake types. With scalar packing
+    enabled, up to three scalar maps are combined into one tuple and baked
+    into the color channels of a single image"""
+    bake_types = get_root_maps(bake_types)
+    if not bpy.context.scene.TextureBake_Props.pack_scalar_bakes:
+        return list(bake_types)
 
-                    if mat.name in mats_done:
-                        functions.print_msg(f"Skipping material {mat.name}, already processed")
-                        # Set the slot to the already created duplicate material and leave
-                        dupmat = [m for m in bpy.data.materials if "SB_dupmat" in m and m["SB_dupmat"] == mat.name][0] # Should only be one
-                        matslot.material = dupmat
-                        continue
-                    else:
-                        mats_done.append(mat.name)
+    scalars = [t for t in bake_types if t in functions.scalar_maps]
+    units = [t for t in bake_types if t not in scalars]
+    for i in range(0, len(scalars), 3):
+        pack = tuple(scalars[i:i+3])
+        units.append(pack if len(pack) > 1 else pack[0])
 
-                    # Duplicate material to work on it
-                    functions.print_msg("Duplicating material")
-                    mat["SB_originalmat"] = mat.name
-                    dup = mat.copy()
-                    dup["SB_dupmat"] = mat.name
-                    matslot.material = dup
-                    # We want to work on dup from now on
-                    mat = dup
+    return units
 
-                    # Make sure we are using nodes
-                    if not mat.use_nodes:
-                        functions.print_msg(f"Material {mat.name} wasn't using nodes. Have enabled nodes")
-                        mat.use_nodes = True
 
-                    nodetree = mat.node_tree
-                    nodes = nodetree.nodes
+def get_constant_value(objects, thisbake):
+    """Returns the value of thisbake if it is constant on all given objects, otherwise None"""
+    # Tiled images can't be filled directly
+    if MasterOperation.bake_op.bake_udims_tiled:
+        return None
+    return material_analysis.get_objects_constant(objects, thisbake)
 
-                    # Create the image node and set to the bake texutre we are using
-                    imgnode = nodes.new("ShaderNodeTexImage")
-                    imgnode.image = bpy.data.images[IMGNAME]
-                    imgnode.label = "TextureBake"
 
-                    # Remove all disconnected nodes so don't interfere with typing the material
-                    functions.remove_disconnected_nodes(nodetree)
+def fill_constant_image(thisbake, IMGNAME, value):
+    """Fills the image of a constant map instead of baking it"""
+    functions.print_msg(f"Map is constant, filling {IMGNAME} without baking")
+    image = bpy.data.images[IMGNAME]
+    if not isinstance(thisbake, tuple):
+        functions.set_image_internal_col_space(image, thisbake)
 
-                    # AO, normal, and emission require no further material prep
-                    if(thisbake not in [constants.PBR_AO, constants.PBR_EMISSION, constants.PBR_NORMAL_DX, constants.PBR_NORMAL_OGL]):
-                        # Work out what type of material we are dealing with here and take correct action
-                        mat_type = functions.get_mat_type(nodetree)
+    functions.report_map_started(thisbake, IMGNAME, "fill")
+    functions.fill_image(image, value)
 
-                        if(mat_type == "MIX"):
-                            functions.setup_mix_material(nodetree, thisbake)
-                        elif(mat_type == "PURE_E"):
-                            functions.setup_pure_e_material(nodetree, thisbake)
-                        elif(mat_type == "PURE_P"):
-                            functions.setup_pure_p_material(nodetree, thisbake)
 
-                    # Last action before leaving this material, make the image node selected and active
-                    functions.deselect_all_nodes(nodes)
-                    imgnode.select = True
-                    nodetree.nodes.active = imgnode
+def copy_direct_image(objects, thisbake, IMGNAME):
+    """Copies the image that thisbake reads unchanged on all given objects into
+    the image IMGNAME. Returns False if the map has to be baked"""
+    # UDIM tiles cover different parts of the source image
+    if MasterOperation.bake_op.bake_udims:
+        return False
 
-                # Select only this object
-                functions.select_only_this(obj)
-                functions.set_image_internal_col_space(bpy.data.images[IMGNAME], thisbake)
+    source = material_analysis.get_objects_image(objects, thisbake)
+    if source is None:
+        return False
+
+    image, output = source
+    functions.print_msg(f"Map is a copy of {image.name}, copying into {IMGNAME} without baking")
+    target = bpy.data.images[IMGNAME]
+    functions.set_image_internal_col_space(target, thisbake)
+
+    functions.report_map_started(thisbake, IMGNAME, "copy")
+    return functions.copy_image(image, target, output)
+
+
+def create_bake_image(objname, thisbake, tile=None):
+    """Creates the image that thisbake renders into and returns its name. For tiled
+    UDIM bakes, this is a tiled image unless a single tile is requested"""
+    current_bake_op = MasterOperation.bake_op
+
+    if isinstance(thisbake, tuple):
+        IMGNAME = functions.gen_image_name(objname, "packed")
+    else:
+        IMGNAME = functions.gen_image_name(objname, thisbake)
+
+    # UDIM testing
+    if current_bake_op.bake_udims:
+        IMGNAME = IMGNAME+f".{tile or current_bake_op.udim_counter}"
+
+    tiled = current_bake_op.bake_udims_tiled and tile is None
+    if isinstance(thisbake, tuple):
+        functions.create_packed_image(IMGNAME, thisbake, tiled)
+    else:
+        functions.create_images(IMGNAME, thisbake, objname, tiled)
+
+    return IMGNAME
+
+
+def finish_bake_image(thisbake, IMGNAME, objname):
+    """Scales and post-processes a baked image. Tiled UDIM bakes are split into one
+    image per tile and packed bakes into one image per map first"""
+    if bpy.data.images[IMGNAME].source == "TILED":
+        for name in functions.split_udim_tiles(bpy.data.images[IMGNAME]):
+            finish_bake_image(thisbake, name, objname)
+        return
+
+    if not isinstance(thisbake, tuple):
+        functions.scale_image_if_needed(bpy.data.images[IMGNAME])
+        derive_maps(thisbake, IMGNAME, objname)
+        do_post_processing(thisbake=thisbake, IMGNAME=IMGNAME)
+        return
+
+    # Per-map images of a single UDIM tile keep the number of that tile
+    tile = IMGNAME.rsplit(".", 1)[-1] if MasterOperation.bake_op.bake_udims else None
+    packed_img = bpy.data.images[IMGNAME]
+    names = [create_bake_image(objname, m, tile) for m in thisbake]
+    images = [bpy.data.images[name] for name in names]
+    for img in images:
+        img.colorspace_settings.name = "Non-Color"
+
+    functions.print_msg(f"Splitting packed image {IMGNAME}")
+    functions.split_packed_image(packed_img, images)
+    bpy.data.images.remove(packed_img)
+
+    for m, name in zip(thisbake, names):
+        functions.write_baked_texture(name)
+        finish_bake_image(m, name, objname)
+
+
+def derive_maps(thisbake, IMGNAME, objname):
+    """Creates the images of all maps of this bake that are derived from thisbake.
+    Has to run before thisbake is post-processed"""
+    bake_types = MasterOperation.bake_op.pbr_selected_bake_types
+    for derived in get_derived_maps(bake_types):
+        if post_processing.derived_maps[derived] != thisbake:
+            continue
+
+        tile = IMGNAME.rsplit(".", 1)[-1] if MasterOperation.bake_op.bake_udims else None
+        name = create_bake_image(objname, derived, tile)
+        functions.report_map_started(derived, name, "derive")
+        functions.print_msg(f"Deriving {name} from {IMGNAME}")
+
+        functions.copy_image_pixels(bpy.data.images[IMGNAME], name)
+
+        # Merged bakes count every map once per object
+        count = 1
+        if MasterOperation.merged_bake and MasterOperation.bake_op.bake_mode == constants.BAKE_MODE_PBR:
+            count = len(MasterOperation.bake_op.bake_objects)
+        for i in range(count):
+            functions.report_map_finished(derived, name)
+        finish_bake_image(derived, name, objname)
+
+
+def setup_material_for_map(nodetree, thisbake, graph):
+    """Wires a duplicate material so that its emission shows thisbake"""
+    # AO, normal, and emission require no further material prep
+    if(thisbake not in [constants.PBR_AO, constants.PBR_EMISSION, constants.PBR_NORMAL_DX, constants.PBR_NORMAL_OGL]):
+        # Take the correct action for the type of material we are dealing with here
+        if(graph.mat_type == "MIX"):
+            functions.setup_mix_material(nodetree, thisbake, graph)
+        elif(graph.mat_type == "PURE_E"):
+            functions.setup_pure_e_material(nodetree, thisbake, graph)
+        elif(graph.mat_type == "PURE_P"):
+            functions.setup_pure_p_material(nodetree, thisbake, graph)
+
+
+def prepare_object_materials(obj, thisbake, IMGNAME):
+    """Replaces the materials of an object with duplicates that bake thisbake into the image IMGNAME"""
+    # Duplicates are shared by identical materials that bake into the same image,
+    # on this object and on the other objects of a merged bake
+    dups = MaterialSwaps.duplicates
+
+    # Prep the materials one by one
+    materials = obj.material_slots
+    for matslot in materials:
+        mat = bpy.data.materials.get(matslot.name)
+        key = (material_analysis.get_material_fingerprint(mat), IMGNAME)
+
+        if key in dups:
+            functions.print_msg(f"Skipping material {mat.name}, an identical material is already processed")
+            # Set the slot to the already created duplicate material and leave
+            functions.swap_material(matslot, dups[key])
+            continue
+
+        # Duplicate material to work on it
+        dups[key] = functions.duplicate_material(matslot)
+        # We want to work on dup from now on
+        mat = dups[key]
+
+        # Make sure we are using nodes
+        if not mat.use_nodes:
+            functions.print_msg(f"Material {mat.name} wasn't using nodes. Have enabled nodes")
+            mat.use_nodes = True
+
+        nodetree = mat.node_tree
+        nodes = nodetree.nodes
+
+        # Create the image node and set to the bake texutre we are using
+        imgnode = nodes.new("ShaderNodeTexImage")
+        imgnode.image = bpy.data.images[IMGNAME]
+        imgnode.label = "TextureBake"
+
+        # The structure of the material is the same for all maps
+        graph = material_analysis.get_material_graph(mat)
+
+        # Remove all disconnected nodes so don't interfere with typing the material
+        functions.remove_disconnected_nodes(nodetree, graph)
+
+        setup_material_for_map(nodetree, thisbake, graph)
+
+        # Last action before leaving this material, make the image node selected and active
+        functions.deselect_all_nodes(nodes)
+        imgnode.select = True
+        nodetree.nodes.active = imgnode
+
+
+def uses_prepared_materials():
+    """Whether materials are duplicated once per bake instead of once per map"""
+    props = bpy.context.scene.TextureBake_Props
+    return props.prepare_materials_once and not props.selected_to_target
+
+
+def switch_object_materials(obj, thisbake, IMGNAME):
+    """Like prepare_object_materials, but the duplicates are made and pruned
+    for the first map only. Later maps reuse them and only switch the bake
+    image and the nodes that route thisbake into the emission shader"""
+    prepared = MasterOperation.prepared_materials.get(obj.name)
+    if prepared is None:
+        # Duplicates as (material, image node name, graph). Objects that bake into
+        # different images need their own duplicates
+        dups = MasterOperation.prepared_duplicates
+        prepared = []
+        for matslot in obj.material_slots:
+            key = material_analysis.get_material_fingerprint(matslot.material)
+            if not MasterOperation.merged_bake:
+                key = (obj.name, key)
+
+            if key not in dups:
+                mat = functions.duplicate_material(matslot)
+                if not mat.use_nodes:
+                    functions.print_msg(f"Material {mat.name} wasn't using nodes. Have enabled nodes")
+                    mat.use_nodes = True
 
-                # Bake the object for this bake mode
-                functions.bake_operation(thisbake, bpy.data.images[IMGNAME])
+                # The graph is taken before any map has changed the duplicate
+                graph = material_analysis.get_material_graph(mat)
+                imgnode = mat.node_tree.nodes.new("ShaderNodeTexImage")
+                imgnode.label = "TextureBake"
+                functions.remove_disconnected_nodes(mat.node_tree, graph)
+                dups[key] = (mat, imgnode.name, graph)
+            prepared.append(dups[key])
+        MasterOperation.prepared_materials[obj.name] = prepared
+
+    for matslot, (mat, imgname, graph) in zip(obj.material_slots, prepared):
+        # Objects sharing mesh data may have put their own duplicates into the slots
+        if matslot.material != mat:
+            functions.swap_material(matslot, mat)
+
+        # Shared duplicates are switched by the first slot that uses them
+        nodetree = mat.node_tree
+        imgnode = nodetree.nodes[imgname]
+        if imgnode.image and imgnode.image.name == IMGNAME:
+            continue
+
+        functions.reset_material_nodes(nodetree, graph)
+        imgnode.image = bpy.data.images[IMGNAME]
+        setup_material_for_map(nodetree, thisbake, graph)
+
+        functions.deselect_all_nodes(nodetree.nodes)
+        imgnode.select = True
+        nodetree.nodes.active = imgnode
+
+
+def do_bake():
+    current_bake_op = MasterOperation.bake_op
+
+    # Linked duplicates get copies of the textures of the first object like them
+    instances = get_bake_instances(current_bake_op.bake_objects)
+
+    # Loop over the bake modes we are using
+    def do_bake_actual():
+        IMGNAME = ""
+        units = get_bake_units(current_bake_op.pbr_selected_bake_types)
+
+        # Objects are done after their last map on the last tile. Their textures
+        # are exported while the next batch bakes
+        last_pass = not current_bake_op.shifts_udim_tiles() or \
+            current_bake_op.udim_counter == bpy.context.scene.TextureBake_Props.udim_tiles + 1000
+
+        def pack_finished_objects(thisbake, objects):
+            if uses_pipelined_export() and last_pass and thisbake == units[-1]:
+                for obj in objects:
+                    pack_object_textures(obj)
+                    if thisbake not in placement_dependent_maps:
+                        for alias in instances.get(obj.name, []):
+                            pack_object_textures(alias)
+
+        def finish_object_image(thisbake, IMGNAME, objname):
+            finish_bake_image(thisbake, IMGNAME, objname)
+            if thisbake not in placement_dependent_maps and instances.get(objname):
+                alias_baked_images(thisbake, objname, instances[objname])
+
+        for thisbake in units:
+            # If we are doing a merged bake, just create one image here
+            if(MasterOperation.merged_bake):
+                functions.print_msg("We are doing a merged bake")
+                IMGNAME = create_bake_image(bpy.context.scene.TextureBake_Props.merged_bake_name, thisbake)
+
+                # A map that is constant on all objects doesn't need a bake
+                value = get_constant_value(current_bake_op.bake_objects, thisbake)
+                if value is not None:
+                    fill_constant_image(thisbake, IMGNAME, value)
+                    for obj in current_bake_op.bake_objects:
+                        functions.report_map_finished(thisbake, IMGNAME)
+                    finish_bake_image(thisbake, IMGNAME, bpy.context.scene.TextureBake_Props.merged_bake_name)
+                    continue
+
+                # So does a map that is a plain image on all objects
+                if copy_direct_image(current_bake_op.bake_objects, thisbake, IMGNAME):
+                    for obj in current_bake_op.bake_objects:
+                        functions.report_map_finished(thisbake, IMGNAME)
+                    finish_bake_image(thisbake, IMGNAME, bpy.context.scene.TextureBake_Props.merged_bake_name)
+                    continue
+
+            objects = current_bake_op.bake_objects
+            if thisbake not in placement_dependent_maps:
+                objects = [obj for obj in objects if obj.name in instances]
+
+            for batch in get_bake_batches(objects):
+                batch_images = []
+                for obj in batch:
+                    functions.print_msg(f"Baking object: {obj.name}")
+
+                    # Truncate if needed from this point forward
+                    OBJNAME = functions.trunc_if_needed(obj.name)
+
+                    # If we are not doing a merged bake
+                    # Create the image we need for this bake (Delete if exists)
+                    if(not MasterOperation.merged_bake):
+                        IMGNAME = create_bake_image(obj.name, thisbake)
+
+                        # A map that is constant on the whole object doesn't need a bake
+                        value = get_constant_value([obj], thisbake)
+                        if value is not None:
+                            fill_constant_image(thisbake, IMGNAME, value)
+                            functions.report_map_finished(thisbake, IMGNAME)
+                            finish_object_image(thisbake, IMGNAME, obj.name)
+                            continue
+
+                        # Neither does a map that is a plain image on the bake UVs
+                        if copy_direct_image([obj], thisbake, IMGNAME):
+                            functions.report_map_finished(thisbake, IMGNAME)
+                            finish_object_image(thisbake, IMGNAME, obj.name)
+                            continue
+
+                    if uses_prepared_materials():
+                        switch_object_materials(obj, thisbake, IMGNAME)
+                    else:
+                        prepare_object_materials(obj, thisbake, IMGNAME)
+                    batch_images.append((IMGNAME, obj.name))
+
+                if not batch_images:
+                    pack_finished_objects(thisbake, batch)
+                    continue
+
+                # Select only the objects in this batch
+                functions.select_only_these(batch)
+                images = [bpy.data.images[name] for name in dict.fromkeys(name for name, _ in batch_images)]
+                if not isinstance(thisbake, tuple):
+                    for img in images:
+                        functions.set_image_internal_col_space(img, thisbake)
+
+                # Bake the objects for this bake mode
+                functions.bake_operation(thisbake, *images)
 
                 # Update tracking
-                BakeStatus.current_map+=1
-                functions.print_msg(f"Bake maps {BakeStatus.current_map} of {BakeStatus.total_maps} complete")
-                functions.write_bake_progress(BakeStatus.current_map, BakeStatus.total_maps)
-                functions.write_baked_texture(IMGNAME)
+                for name, _ in batch_images:
+                    functions.report_map_finished(thisbake, name)
 
-                # Restore the original materials
-                functions.print_msg("Restoring original materials")
-                functions.restore_all_materials()
-                functions.print_msg("Restore complete")
+                # Restore the original materials, prepared duplicates are kept for the next map
+                if not uses_prepared_materials():
+                    functions.print_msg("Restoring original materials")
+                    functions.restore_all_materials()
+                    functions.print_msg("Restore complete")
 
                 if not MasterOperation.merged_bake:
-                    functions.scale_image_if_needed(bpy.data.images[IMGNAME])
-                    do_post_processing(thisbake=thisbake, IMGNAME=IMGNAME)
+                    for name, objname in batch_images:
+                        finish_object_image(thisbake, name, objname)
+
+                pack_finished_objects(thisbake, batch)
 
             # If we did a merged bake, and we are saving externally, then save here
             if MasterOperation.merged_bake:
-                functions.scale_image_if_needed(bpy.data.images[IMGNAME])
-                do_post_processing(thisbake=thisbake, IMGNAME=IMGNAME)
+                finish_bake_image(thisbake, IMGNAME, bpy.context.scene.TextureBake_Props.merged_bake_name)
 
     # Do the bake at least once
     do_bake_actual()
     current_bake_op.udim_counter = current_bake_op.udim_counter + 1
 
     # If we are doing UDIMs, we need to go back in
-    if current_bake_op.bake_udims:
+    if current_bake_op.shifts_udim_tiles():
         while current_bake_op.udim_counter < bpy.context.scene.TextureBake_Props.udim_tiles + 1001:
             functions.print_msg(f"Going back in for tile {current_bake_op.udim_counter}")
             for obj in current_bake_op.bake_objects:
@@ -766,6 +1153,12 @@ def do_bake():
             do_bake_actual()
             current_bake_op.udim_counter = current_bake_op.udim_counter + 1
 
+    if uses_prepared_materials():
+        functions.print_msg("Restoring original materials")
+        functions.restore_all_materials()
+        MasterOperation.prepared_materials = {}
+        MasterOperation.prepared_duplicates = {}
+
 
 def do_bake_selected_to_target():
     current_bake_op = MasterOperation.bake_op
@@ -777,7 +1170,7 @@ def do_bake_selected_to_target():
     def do_bake_selected_to_target_actual():
         IMGNAME = ""
 
-        for thisbake in current_bake_op.pbr_selected_bake_types:
+        for thisbake in get_root_maps(current_bake_op.pbr_selected_bake_types):
             # We just need the one image for each bake mode, created at the target object
             functions.print_msg("We are bakikng PBR maps to target mesh")
             IMGNAME = functions.gen_image_name(current_bake_op.sb_target_object.name, thisbake)
@@ -786,7 +1179,7 @@ def do_bake_selected_to_target():
             if current_bake_op.bake_udims:
                 IMGNAME = IMGNAME+f".{current_bake_op.udim_counter}"
 
-            functions.create_images(IMGNAME, thisbake, current_bake_op.sb_target_object.name)
+            functions.create_images(IMGNAME, thisbake, current_bake_op.sb_target_object.name, current_bake_op.bake_udims_tiled)
 
             # Prep the target object
             materials = current_bake_op.sb_target_object.material_slots
@@ -811,8 +1204,8 @@ def do_bake_selected_to_target():
                 imgnode.select = True
                 nodetree.nodes.active = imgnode
 
-            # Reset the already processed list before loop
-            mats_done = []
+            # Duplicates created for this bake mode, by material fingerprint
+            dups = {}
 
             # Now prep all the objects for this bake mode
             for obj in current_bake_op.bake_objects:
@@ -829,44 +1222,38 @@ def do_bake_selected_to_target():
                 materials = obj.material_slots
                 for matslot in materials:
                     mat = bpy.data.materials.get(matslot.name)
+                    key = material_analysis.get_material_fingerprint(mat)
 
-                    # Skip if in done list, else record in done list
-                    if mat.name in mats_done:
-                        functions.print_msg(f"Skipping material {mat.name}, already processed")
+                    # Skip if an identical material is already processed
+                    if key in dups:
+                        functions.print_msg(f"Skipping material {mat.name}, an identical material is already processed")
                         # Set the slot to the already created duplicate material and leave
-                        dupmat = [m for m in bpy.data.materials if "SB_dupmat" in m and m["SB_dupmat"] == mat.name][0] # Should only be one
-                        matslot.material = dupmat
+                        functions.swap_material(matslot, dups[key])
                         continue
 
-                    else:
-                        mats_done.append(mat.name)
-
                     # Duplicate material to work on it
-                    functions.print_msg("Duplicating material")
-                    mat["SB_originalmat"] = mat.name
-                    dup = mat.copy()
-                    dup["SB_dupmat"] = mat.name
-                    matslot.material = dup
+                    dups[key] = functions.duplicate_material(matslot)
                     # We want to work on dup from now on
-                    mat = dup
+                    mat = dups[key]
 
                     nodetree = mat.node_tree
                     nodes = nodetree.nodes
 
+                    # The structure of the material is the same for all maps
+                    graph = material_analysis.get_material_graph(mat)
+
                     # Remove all disconnected nodes so don't interfere with typing the material
-                    functions.remove_disconnected_nodes(nodetree)
+                    functions.remove_disconnected_nodes(nodetree, graph)
 
                     # Normal and emission bakes require no further material prep. Just skip the rest
                     if(thisbake not in [constants.PBR_EMISSION, constants.PBR_NORMAL_DX, constants.PBR_NORMAL_OGL]):
-                        # Work out what type of material we are dealing with here and take correct action
-                        mat_type = functions.get_mat_type(nodetree)
-
-                        if(mat_type == "MIX"):
-                            functions.setup_mix_material(nodetree, thisbake)
-                        elif(mat_type == "PURE_E"):
-                            functions.setup_pure_e_material(nodetree, thisbake)
-                        elif(mat_type == "PURE_P"):
-                            functions.setup_pure_p_material(nodetree, thisbake)
+                        # Take the correct action for the type of material we are dealing with here
+                        if(graph.mat_type == "MIX"):
+                            functions.setup_mix_material(nodetree, thisbake, graph)
+                        elif(graph.mat_type == "PURE_E"):
+                            functions.setup_pure_e_material(nodetree, thisbake, graph)
+                        elif(graph.mat_type == "PURE_P"):
+                            functions.setup_pure_p_material(nodetree, thisbake, graph)
 
                 # Make sure that correct objects are selected right before bake
                 bpy.ops.object.select_all(action="DESELECT")
@@ -882,10 +1269,7 @@ def do_bake_selected_to_target():
             functions.bake_operation(thisbake, bpy.data.images[IMGNAME])
 
             # Update tracking
-            BakeStatus.current_map+=1
-            functions.print_msg(f"Bake maps {BakeStatus.current_map} of {BakeStatus.total_maps} complete")
-            functions.write_bake_progress(BakeStatus.current_map, BakeStatus.total_maps)
-            functions.write_baked_texture(IMGNAME)
+            functions.report_map_finished(thisbake, IMGNAME)
 
             # Restore the original materials
             functions.restore_all_materials()
@@ -898,15 +1282,14 @@ def do_bake_selected_to_target():
                     if node.label == "TextureBake":
                         mat.node_tree.nodes.remove(node)
 
-            functions.scale_image_if_needed(bpy.data.images[IMGNAME])
-            do_post_processing(thisbake=thisbake, IMGNAME=IMGNAME)
+            finish_bake_image(thisbake, IMGNAME, current_bake_op.sb_target_object.name)
 
     # Do the bake at least once
     do_bake_selected_to_target_actual()
     current_bake_op.udim_counter = current_bake_op.udim_counter + 1
 
     # If we are doing UDIMs, we need to go back in
-    if current_bake_op.bake_udims:
+    if current_bake_op.shifts_udim_tiles():
 
         while current_bake_op.udim_counter < bpy.context.scene.TextureBake_Props.udim_tiles + 1001:
             functions.print_msg(f"Going back in for tile {current_bake_op.udim_counter}")
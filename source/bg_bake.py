@@ -18,10 +18,20 @@
 #########################################################################
 
 import bpy
+import json
 import os
+import queue
+import shutil
+import subprocess
+import sys
 import tempfile
+import threading
 from pathlib import Path
-from . import functions
+from . import (
+    bake_plan,
+    functions,
+    material_analysis,
+)
 
 
 class background_bake_ops():
@@ -30,12 +40,129 @@ class background_bake_ops():
     bgops_list_finished = []
 
 
+class persistent_workers():
+    processes = []
+    job_counter = 0
+
+
+class bake_events():
+    # Filled by the threads that read the output of bake processes,
+    # emptied by the UI timer on the main thread
+    queue = queue.Queue()
+
+
+class BackgroundBakeJob:
+    def __init__(self, uid, process, persistent=False):
+        # The uid names the blend file written by the job
+        self.uid = uid
+        self.process = process
+        self.persistent = persistent
+        self.progress = 0
+        self.finished = False
+        # Result reported by persistent workers, one of FINISHED, CANCELLED or FAILED
+        self.status = "FINISHED"
+        self.textures = []
+        self.maps = []
+        self.messages = []
+
+
 class BackgroundBakeParams:
-    def __init__(self, proc, name):
-        self.process = proc
+    def __init__(self, jobs, name):
+        # All jobs of a worker pool are presented as one bake.
+        # The first job identifies the bake in the UI.
+        self.jobs = jobs
+        self.uid = jobs[0].uid
         self.name = name if name else "Untitled"
         self.progress = 0
 
+    def baked_textures(self):
+        """Returns the textures baked by all jobs of this bake"""
+        textures = []
+        for job in self.jobs:
+            textures += job.textures
+        return list(dict.fromkeys(textures))
+
+    def errors(self):
+        """Returns the error messages reported by all jobs of this bake"""
+        return [m["message"] for job in self.jobs for m in job.messages if m["type"] == "error"]
+
+
+def get_job_blend_path(uid):
+    return Path(tempfile.gettempdir()) / f"{uid}.blend"
+
+
+def remove_job_files(uid):
+    """Deletes the blend files of a finished bake job"""
+    path = get_job_blend_path(uid)
+    for p in [path, path.with_suffix(".blend1")]:
+        try:
+            p.unlink()
+        except:
+            pass
+
+
+def read_process_output(process):
+    """Runs on a separate thread for each bake process. Bake events are queued
+    for the main thread, everything else is passed through to the console"""
+    for line in iter(process.stdout.readline, ""):
+        if line.startswith(functions.BAKE_EVENT_PREFIX):
+            try:
+                bake_events.queue.put(json.loads(line[len(functions.BAKE_EVENT_PREFIX):]))
+            except ValueError:
+                sys.stdout.write(line)
+        else:
+            sys.stdout.write(line)
+
+    process.stdout.close()
+    bake_events.queue.put({"type": "process_exited", "pid": process.pid, "returncode": process.wait()})
+
+
+def open_bake_process(args, **kwargs):
+    """Starts a Blender process and starts listening to its bake events"""
+    process = subprocess.Popen(args,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1,
+        shell=False,
+        **kwargs)
+    threading.Thread(target=read_process_output, args=(process,), daemon=True).start()
+    return process
+
+
+def handle_bake_event(event, jobs):
+    if event["type"] == "process_exited":
+        for job in jobs.values():
+            if job.process.pid == event["pid"] and not job.finished:
+                job.finished = True
+                # Persistent workers only exit in the middle of a job if they crash,
+                # one-shot processes report failed bakes through their exit code
+                if job.persistent:
+                    job.status = "FAILED"
+                    job.messages.append({"type": "error", "message": f"Bake worker exited during job {job.uid}"})
+                elif event.get("returncode") != 0:
+                    job.status = "FAILED"
+                    job.messages.append({"type": "error", "message": f"Bake process exited with code {event.get('returncode')}"})
+        return
+
+    job = jobs.get(event.get("job"))
+    if not job:
+        return
+
+    if event["type"] == "map_finished":
+        job.progress = int((event["current"] / event["total"]) * 100) if event["total"] else 100
+        job.maps.append(event)
+    elif event["type"] == "texture":
+        job.textures.append(event["name"])
+    elif event["type"] in ["warning", "error"]:
+        job.messages.append(event)
+    elif event["type"] == "job_finished":
+        job.finished = True
+        job.status = event.get("status", "FINISHED")
+        if job.status != "FINISHED":
+            job.messages.append({"type": "error", "message": f"Bake job {job.uid} did not finish ({job.status.lower()})"})
+
 
 def refresh_bake_progress():
     """Updates baking progress for all active background bake processes"""
@@ -43,21 +170,200 @@ def refresh_bake_progress():
         bpy.app.timers.unregister(refresh_bake_progress)
         return None
 
-    for p in background_bake_ops.bgops_list:
-        t = Path(tempfile.gettempdir())
-        t = t / f"TextureBake_propgress_{str(p.process.pid)}"
+    jobs = {job.uid: job for p in background_bake_ops.bgops_list for job in p.jobs}
+    while True:
         try:
-            with open(str(t), "r") as progfile:
-                p.progress = int(progfile.readline())
-        except:
-            pass
+            event = bake_events.queue.get_nowait()
+        except queue.Empty:
+            break
+        handle_bake_event(event, jobs)
 
-        if p.process.poll() == 0:
+    for p in background_bake_ops.bgops_list.copy():
+        p.progress = int(sum(job.progress for job in p.jobs) / len(p.jobs))
+
+        if all(job.finished for job in p.jobs):
+            bake_plan.record_map_timings([m for job in p.jobs for m in job.maps])
             background_bake_ops.bgops_list_finished.append(p)
             background_bake_ops.bgops_list.remove(p)
 
     functions.redraw_property_panel()
-    return 1
+    return 0.2
+
+
+def split_objects(objects, num_shards):
+    """Distributes objects round-robin over at most num_shards lists"""
+    num_shards = max(1, min(num_shards, len(objects)))
+    return [objects[i::num_shards] for i in range(num_shards)]
+
+
+def get_worker_args_list(objects, threads):
+    args = []
+    if objects is not None:
+        args += ["--objects", json.dumps([obj.name for obj in objects])]
+    if threads:
+        args += ["--threads", str(threads)]
+    return args
+
+
+def start_bake_process(path, operator, objects=None, threads=0):
+    """Starts a background Blender process that runs the given bake operator on a copy of the blend file"""
+    # Failed and cancelled bakes make the process exit with code 1
+    args = [bpy.app.binary_path, "--background", path, "--python-exit-code", "1", "--python-expr",\
+        "import bpy; import os; from pathlib import Path;\
+        savepath=Path(bpy.data.filepath).parent / (str(os.getpid()) + \".blend\");\
+        bpy.ops.wm.save_as_mainfile(filepath=str(savepath), check_existing=False);\
+        assert 'FINISHED' in bpy.ops." + operator + "(), 'Bake did not finish';"]
+
+    # Blender ignores everything after the double dash, which leaves it to us
+    worker_args = get_worker_args_list(objects, threads)
+    if worker_args:
+        args += ["--"] + worker_args
+
+    process = open_bake_process(args)
+    return BackgroundBakeJob(str(process.pid), process)
+
+
+def get_persistent_workers(count):
+    """Returns the requested number of persistent bake workers, starting new ones if needed"""
+    workers = [w for w in persistent_workers.processes if w.poll() is None]
+    while len(workers) < count:
+        functions.print_msg("Starting persistent bake worker")
+        expr = f"import importlib; importlib.import_module('{__package__}.bg_bake').serve_bake_jobs()"
+        process = open_bake_process(
+            [bpy.app.binary_path, "--background", "--python-expr", expr],
+            stdin=subprocess.PIPE)
+        workers.append(process)
+
+    persistent_workers.processes = workers
+    return workers[:count]
+
+
+def stop_persistent_workers():
+    """Shuts down all persistent bake workers"""
+    for process in persistent_workers.processes:
+        try:
+            process.stdin.close()
+            process.kill()
+        except:
+            pass
+    persistent_workers.processes = []
+
+
+def submit_bake_job(worker, path, operator, objects=None, threads=0):
+    """Sends a bake job to a persistent worker. The worker opens the blend file
+    at path, bakes it and saves the result to the same file"""
+    persistent_workers.job_counter += 1
+    uid = f"{os.getpid()}_{persistent_workers.job_counter}"
+    job_path = get_job_blend_path(uid)
+    shutil.copyfile(path, str(job_path))
+
+    job = {
+        "uid": uid,
+        "blend": str(job_path),
+        "operator": operator,
+        "args": get_worker_args_list(objects, threads),
+    }
+    if worker.poll() is None:
+        try:
+            worker.stdin.write(json.dumps(job) + "\n")
+            worker.stdin.flush()
+            return BackgroundBakeJob(uid, worker, persistent=True)
+        except OSError:
+            pass
+
+    # The worker has exited in the meantime, the job runs in a process of its own instead
+    functions.print_msg("Bake worker is gone, starting a separate bake process")
+    remove_job_files(uid)
+    return start_bake_process(path, operator, objects, threads)
+
+
+def serve_bake_jobs():
+    """Main loop of a persistent bake worker. Reads bake jobs from stdin until
+    the parent process closes the pipe. Blender, the add-on and the render
+    engine stay loaded between jobs"""
+    for line in iter(sys.stdin.readline, ""):
+        if not line.strip():
+            continue
+
+        job = json.loads(line)
+        functions.bake_job_id = job["uid"]
+        worker_job_args.clear()
+        worker_job_args.extend(job["args"])
+        functions.print_msg(f"Starting bake job {job['uid']}")
+
+        status = "FAILED"
+        try:
+            bpy.ops.wm.open_mainfile(filepath=job["blend"])
+            material_analysis.clear_material_graphs()
+            op = bpy.ops
+            for part in job["operator"].split("."):
+                op = getattr(op, part)
+            status = "FINISHED" if "FINISHED" in op() else "CANCELLED"
+        except Exception as e:
+            functions.print_error(f"Bake job {job['uid']} failed: {e}")
+
+        functions.emit_bake_event("job_finished", status=status)
+
+
+def start_background_bake(operator, name):
+    """Bakes a copy of the current blend file in the background. Depending on the
+    number of configured workers, the objects are split across several processes"""
+    props = bpy.context.scene.TextureBake_Props
+    path = str(Path(tempfile.gettempdir()) / f"{os.getpid()}.blend")
+    bpy.ops.wm.save_as_mainfile(filepath=path, copy=True, check_existing=False)
+
+    # Merged bakes and bakes to a target object write into shared images
+    # and can't be split up between processes
+    shards = [None]
+    if props.bake_workers > 1 and not props.merged_bake and not props.selected_to_target:
+        objects = bpy.context.selected_objects
+        if props.use_object_list:
+            objects = functions.advanced_object_selection_to_list()
+        shards = split_objects(objects, props.bake_workers)
+
+    threads = 0
+    if len(shards) > 1:
+        threads = max(1, (os.cpu_count() or 1) // len(shards))
+        functions.print_msg(f"Starting {len(shards)} bake workers with {threads} threads each")
+
+    if props.use_persistent_workers:
+        workers = get_persistent_workers(len(shards))
+        jobs = [submit_bake_job(w, path, operator, s, threads) for w, s in zip(workers, shards)]
+    else:
+        jobs = [start_bake_process(path, operator, s, threads) for s in shards]
+
+    background_bake_ops.bgops_list.append(BackgroundBakeParams(jobs, name))
+    bpy.app.timers.register(refresh_bake_progress)
+
+
+# Arguments of the job that a persistent worker is currently baking
+worker_job_args = []
+
+def get_worker_arg(name):
+    """Returns the value of an argument passed to this background bake process by its parent"""
+    argv = worker_job_args
+    if not argv and "--" in sys.argv:
+        argv = sys.argv[sys.argv.index("--") + 1:]
+    if f"--{name}" in argv:
+        index = argv.index(f"--{name}") + 1
+        if index < len(argv):
+            return argv[index]
+    return None
+
+
+def get_worker_objects():
+    """Returns the names of the objects this process is supposed to bake
+    or None if it is not part of a worker pool"""
+    objects = get_worker_arg("objects")
+    if objects is None:
+        return None
+    return json.loads(objects)
+
+
+def get_worker_threads():
+    """Returns the number of render threads assigned to this process or 0 for automatic detection"""
+    threads = get_worker_arg("threads")
+    return int(threads) if threads else 0
 
 
 def clean_object_list():
@@ -0,0 +1,80 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import (
+    functions,
+    image_encoder,
+)
+
+
+class export_queue():
+    executor = None
+    # Pending exports as (path, future)
+    pending = []
+
+
+def get_executor():
+    if export_queue.executor is None:
+        workers = max(1, (os.cpu_count() or 2) // 2)
+        export_queue.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="TextureBakeExport")
+    return export_queue.executor
+
+
+def can_export(file_format, bit_depth):
+    """Whether textures of this format can be written without Blender"""
+    return image_encoder.can_encode(file_format, bit_depth)
+
+
+def write_image(pixels, width, height, path, file_format, bit_depth, compression=6):
+    """Encodes and writes an image without Blender. Runs on an export
+    thread in pipelined exports, so it must not touch bpy"""
+    data = image_encoder.encode(pixels, width, height, file_format, bit_depth, compression)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temp file first so a crash never leaves half a texture behind
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def submit(pixels, width, height, path, file_format, bit_depth, compression=6):
+    """Queues linear RGBA float pixels for encoding and writing on an export thread.
+    The pixel array must not be modified afterwards"""
+    path = Path(path)
+    functions.print_msg(f"Queueing export of {path.name}")
+    future = get_executor().submit(write_image, pixels, width, height, path, file_format, bit_depth, compression)
+    export_queue.pending.append((path, future))
+
+
+def wait_for_exports():
+    """Blocks until all queued textures have been written"""
+    if export_queue.pending:
+        functions.print_msg(f"Waiting for {len(export_queue.pending)} texture exports")
+
+    for path, future in export_queue.pending:
+        try:
+            future.result()
+        except Exception as e:
+            functions.print_error(f"Could not export {path}: {e}")
+
+    export_queue.pending = []
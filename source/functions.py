@@ -22,19 +22,28 @@ from pathlib import Path
 import shutil
 import bpy
 import datetime
+import hashlib
 import os
 import base64
+import json
+import numpy as np
 import sys
 import tempfile
+import time
 
 from . import (
     constants,
+    material_analysis,
     material_setup,
+    resampling,
 )
 
 from .bake_operation import (
+    BakedImages,
     BakeOperation,
     MasterOperation,
+    MaterialSwaps,
+    BakeStatus,
 )
 
 
@@ -55,13 +64,43 @@ psocketname = {
     constants.PBR_SSS_COL: "Subsurface Color"
 }
 
+# Maps that fill a single channel when baked to an emission shader
+scalar_maps = [
+    constants.PBR_METAL,
+    constants.PBR_ROUGHNESS,
+    constants.PBR_TRANSMISSION,
+    constants.PBR_TRANSMISSION_ROUGH,
+    constants.PBR_CLEARCOAT,
+    constants.PBR_CLEARCOAT_ROUGH,
+    constants.PBR_SPECULAR,
+    constants.PBR_OPACITY,
+    constants.PBR_SSS,
+]
+
 def print_msg(msg):
     print(f"TEXTUREBAKE: {msg}")
 
 
+def print_error(msg):
+    print_msg(f"ERROR: {msg}")
+    emit_bake_event("error", message=msg)
+
+
+def print_warning(msg):
+    print_msg(f"WARNING: {msg}")
+    emit_bake_event("warning", message=msg)
+
+
 def does_object_have_bakes(obj):
-    for img in bpy.data.images:
-        return "SB_objname" in img # SB_objname is always set. Even for merged_bake
+    return len(BakedImages.find(obj.name)) > 0 # SB_objname is always set. Even for merged_bake
+
+
+def remove_image(image):
+    """Removes an image and drops it from the bake results and the baked image index"""
+    BakedImages.remove(image)
+    if image in MasterOperation.baked_textures:
+        MasterOperation.baked_textures.remove(image)
+    bpy.data.images.remove(image)
 
 
 def gen_export_texture_name(name_format, obj_name):
@@ -122,55 +161,77 @@ def gen_image_name(obj_name, baketype):
     return "_".join(parts)
 
 
-def remove_disconnected_nodes(nodetree):
+def remove_disconnected_nodes(nodetree, graph=None):
+    """Removes the shader nodes that don't lead to the active material output"""
+    graph = graph or material_analysis.MaterialGraph(nodetree)
+
+    # Without an output, nothing is a player
+    if not graph.output:
+        return
+
     nodes = nodetree.nodes
+    for name in graph.unused:
+        nodes.remove(nodes[name])
+
+
+def swap_material(matslot, dup):
+    """Puts a duplicate material into a slot and records the swap for restore_all_materials"""
+    MaterialSwaps.swaps.append((matslot, matslot.material, dup))
+    matslot.material = dup
+
+
+def duplicate_material(matslot):
+    """Replaces the material of a slot with a copy to work on and returns the copy.
+    Slots that already hold a duplicate get a fresh copy of the original"""
+    mat = material_analysis.get_source_material(matslot.material)
+    print_msg("Duplicating material")
+    mat["SB_originalmat"] = mat.name
+    dup = mat.copy()
+    dup["SB_dupmat"] = mat.name
+    swap_material(matslot, dup)
+    return dup
+
+
+def is_valid(block):
+    """Whether a datablock still exists after it was removed in this session.
+    References don't survive opening another blend file and can't be checked
+    like this, they have to be dropped before the file is loaded"""
+    try:
+        block.name
+        return True
+    except ReferenceError:
+        return False
 
-    # Loop through nodes
-    repeat = False
-    for node in nodes:
-        if node.type == "BSDF_PRINCIPLED" and len(node.outputs[0].links) == 0:
-            # Not a player, delete node
-            nodes.remove(node)
-            repeat = True
-        elif node.type == "EMISSION" and len(node.outputs[0].links) == 0:
-            # Not a player, delete node
-            nodes.remove(node)
-            repeat = True
-        elif node.type == "MIX_SHADER" and len(node.outputs[0].links) == 0:
-            # Not a player, delete node
-            nodes.remove(node)
-            repeat = True
 
-    # If we removed any nodes, we need to do this again
-    if repeat:
-        remove_disconnected_nodes(nodetree)
+def get_material_id_color(mat):
+    """Returns the color a material gets in material ID maps. It only depends on
+    the name of the original material, so every bake process picks the same one"""
+    name = material_analysis.get_source_material(mat).name
+    digest = hashlib.md5(name.encode("utf-8")).digest()
+    return (digest[0] / 255, digest[1] / 255, digest[2] / 255, 1.0)
 
 
 def restore_all_materials():
-    for obj in bpy.data.objects:
-        if (obj.material_slots != None) and (len(obj.material_slots) > 0):# Stop the error where Nonetype not iterable
-            # Get all slots that are using a dup mat
-            dup_mats_slots_list = [slot for slot in obj.material_slots if slot.material != None and "SB_dupmat" in slot.material]
-
-            # Swap those slos back to the original version of their material
-            for dup_mat_slot in dup_mats_slots_list:
-                dup_mat = dup_mat_slot.material
-                orig_mat_name = dup_mat["SB_dupmat"]
-                orig_mat = [mat for mat in bpy.data.materials if "SB_originalmat" in mat and mat["SB_originalmat"] == orig_mat_name][0] # Should only be one
-                dup_mat_slot.material = orig_mat
+    # Go backwards, objects sharing a mesh can swap the same slot more than once
+    dups = {}
+    for slot, original, dup in reversed(MaterialSwaps.swaps):
+        slot.material = original
+        dups[dup.as_pointer()] = dup
 
     # Delete all duplicates (should no longet be any in use)
-    del_list = [mat for mat in bpy.data.materials if "SB_dupmat" in mat]
-    for mat in del_list:
+    for mat in dups.values():
         bpy.data.materials.remove(mat)
 
+    MaterialSwaps.swaps = []
+    MaterialSwaps.duplicates = {}
+
 
 def is_blend_saved():
     path = bpy.data.filepath
     return path != "/" and path != ""
 
 
-def create_images(imgname, thisbake, objname):
+def create_images(imgname, thisbake, objname, tiled=False):
     # thisbake is subtype e.g. diffuse, ao, etc.
     current_bake_op = MasterOperation.bake_op
     global_mode = current_bake_op.bake_mode
@@ -178,24 +239,12 @@ def create_images(imgname, thisbake, objname):
 
     print_msg(f"Creating image {imgname}")
 
-    # Get the image height and width from the interface
-    input_height = bpy.context.scene.TextureBake_Props.input_height
-    input_width = bpy.context.scene.TextureBake_Props.input_width
-
     # If it already exists, remove it.
     if imgname in bpy.data.images:
-        bpy.data.images.remove(bpy.data.images[imgname])
+        remove_image(bpy.data.images[imgname])
 
     # Either way, create the new image
-    if bpy.context.scene.TextureBake_Props.bake_32bit_float:
-        image = bpy.data.images.new(imgname, input_width, input_height, float_buffer=True)
-    else:
-        image = bpy.data.images.new(imgname, input_width, input_height, float_buffer=False)
-
-    if thisbake in [constants.PBR_NORMAL_DX, constants.PBR_NORMAL_OGL]:
-        image.generated_color = (0.5,0.5,1.0,1.0)
-    elif thisbake in [constants.PBR_DIFFUSE, constants.PBR_ROUGHNESS]:
-        image.generated_color = (0.5,0.5,0.5,1.0)
+    image = new_bake_image(imgname, bpy.context.scene.TextureBake_Props.bake_32bit_float, tiled, get_generated_color(thisbake))
 
     # Set tags
     image["SB_objname"] = objname
@@ -212,6 +261,219 @@ def create_images(imgname, thisbake, objname):
 
     # Store it at bake operation level
     MasterOperation.baked_textures.append(image)
+    BakedImages.add(image)
+
+
+def new_bake_image(imgname, float_buffer, tiled=False, color=(0.0, 0.0, 0.0, 1.0)):
+    """Creates an image with the input texture size. Tiled images get one tile per UDIM"""
+    props = bpy.context.scene.TextureBake_Props
+    image = bpy.data.images.new(imgname, props.input_width, props.input_height, float_buffer=float_buffer, tiled=tiled)
+    image.generated_color = color
+    if tiled:
+        for tile in range(1002, 1001 + props.udim_tiles):
+            image.tiles.new(tile_number=tile)
+            fill_image_tile(image, tile, props.input_width, props.input_height, float_buffer, color)
+        image.tiles.active = image.tiles[0]
+    return image
+
+
+def fill_image_tile(image, tile, width, height, float_buffer, color):
+    """Generates the pixels of a UDIM tile. Only the first tile of a new tiled image
+    has pixels, Cycles can't bake into tiles added with tiles.new until they are filled"""
+    image.tiles.active = image.tiles.get(tile)
+    args = {"color": color, "generated_type": "BLANK", "width": width, "height": height, "float": float_buffer, "alpha": True}
+    if hasattr(bpy.context, "temp_override"):
+        with bpy.context.temp_override(edit_image=image):
+            bpy.ops.image.tile_fill(**args)
+    else:
+        bpy.ops.image.tile_fill({"edit_image": image}, **args)
+
+
+def split_udim_tiles(image):
+    """Replaces a tiled image with one image per tile. The new images are named
+    and tagged like the images of a bake that shifts UVs for every tile.
+    Returns the names of the new images"""
+    print_msg(f"Splitting UDIM tiles of {image.name}")
+
+    # Blender can only save all tiles at once, so we go through temp files
+    tmpdir = tempfile.mkdtemp()
+    root = image.name.rsplit(".", 1)[0]
+    ext = "exr" if image.is_float else "png"
+    image.filepath_raw = str(Path(tmpdir) / f"{root}.<UDIM>.{ext}")
+    image.file_format = "OPEN_EXR" if image.is_float else "PNG"
+    image.save()
+
+    tiles = [tile.number for tile in image.tiles]
+    image_name = image.name
+    tags = {key: image[key] for key in image.keys() if key.startswith("SB_")}
+    colorspace = image.colorspace_settings.name
+
+    remove_image(image)
+
+    names = []
+    for tile in tiles:
+        name = f"{root}.{tile}"
+        if name in bpy.data.images:
+            remove_image(bpy.data.images[name])
+
+        # Tiles without pixels aren't saved, they never received a bake
+        tile_path = Path(tmpdir) / f"{root}.{tile}.{ext}"
+        if not tile_path.exists():
+            print_error(f"UDIM tile {tile} of {image_name} has no pixels and was not baked")
+            continue
+
+        tile_img = bpy.data.images.load(str(tile_path))
+        tile_img.name = name
+        tile_img.colorspace_settings.name = colorspace
+        tile_img.pack()
+        for key, value in tags.items():
+            tile_img[key] = value
+
+        # Untagged images are temporary and not part of the bake results
+        if tags:
+            tile_img.use_fake_user = True
+            MasterOperation.baked_textures.append(tile_img)
+            BakedImages.add(tile_img)
+
+        names.append(name)
+
+    shutil.rmtree(tmpdir)
+    return names
+
+
+def get_generated_color(thisbake):
+    """Returns the background color of a new image for the given bake type"""
+    if thisbake in [constants.PBR_NORMAL_DX, constants.PBR_NORMAL_OGL]:
+        return (0.5, 0.5, 1.0, 1.0)
+    elif thisbake in [constants.PBR_DIFFUSE, constants.PBR_ROUGHNESS]:
+        return (0.5, 0.5, 0.5, 1.0)
+    return (0.0, 0.0, 0.0, 1.0)
+
+
+def create_packed_image(imgname, maps, tiled=False):
+    """Creates an image that bakes up to three scalar maps into its color channels.
+    The image is not tagged as a baked texture and is removed after splitting"""
+    print_msg(f"Creating packed image {imgname} for {', '.join(maps)}")
+
+    props = bpy.context.scene.TextureBake_Props
+    if imgname in bpy.data.images:
+        bpy.data.images.remove(bpy.data.images[imgname])
+
+    # Every channel gets the same background as a separate bake of its map
+    color = [0.0, 0.0, 0.0, 1.0]
+    for i, thisbake in enumerate(maps):
+        color[i] = get_generated_color(thisbake)[0]
+    image = new_bake_image(imgname, props.bake_32bit_float, tiled, tuple(color))
+    image.colorspace_settings.name = "Non-Color"
+
+    return image
+
+
+def split_packed_image(packed_img, images):
+    """Copies the color channels of a packed scalar bake into separate images"""
+    width, height = packed_img.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    packed_img.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(-1, 4)
+
+    for i, img in enumerate(images):
+        # A scalar emission bake stores the same value in all color channels
+        out = np.empty_like(pixels)
+        out[:, 0:3] = pixels[:, i:i+1]
+        out[:, 3] = pixels[:, 3]
+        img.pixels.foreach_set(out.ravel())
+        img.pack()
+
+
+def linear_to_srgb(values):
+    values = np.maximum(values, 0.0)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1.0 / 2.4) - 0.055)
+
+
+def srgb_to_linear(values):
+    return np.where(values <= 0.04045, values / 12.92, np.power((values + 0.055) / 1.055, 2.4))
+
+
+def set_image_pixels(image, pixels):
+    """Writes linear RGBA pixels into an image and packs it"""
+    # Byte images store color encoded in their color space
+    if not image.is_float and image.colorspace_settings.name == "sRGB":
+        pixels[:, 0:3] = linear_to_srgb(pixels[:, 0:3])
+
+    image.pixels.foreach_set(pixels.astype(np.float32).ravel())
+    image.pack()
+
+
+def fill_image(image, color):
+    """Sets all pixels of an image to the given linear color"""
+    pixels = np.tile(np.array(color, dtype=np.float32), (image.size[0] * image.size[1], 1))
+    set_image_pixels(image, pixels)
+
+
+def get_image_pixels(image, size=None):
+    """Returns the pixels of an image as RGBA in an array of shape (pixels, 4).
+    If size is given, the pixels are resampled to that size"""
+    width, height = image.size
+    channels = image.channels
+    pixels = np.empty(width * height * channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(-1, channels)
+
+    # Bring everything to RGBA
+    if channels == 1:
+        pixels = np.repeat(pixels, 3, axis=1)
+    if pixels.shape[1] == 3:
+        pixels = np.hstack([pixels, np.ones((pixels.shape[0], 1), dtype=np.float32)])
+    elif pixels.shape[1] == 2:
+        pixels = np.hstack([np.repeat(pixels[:, 0:1], 3, axis=1), pixels[:, 1:2]])
+
+    if size and tuple(image.size) != tuple(size):
+        # Filtering sRGB values would darken edges, so it happens in linear light
+        encoded = not image.is_float and image.colorspace_settings.name == "sRGB"
+        if encoded:
+            pixels[:, 0:3] = srgb_to_linear(pixels[:, 0:3])
+
+        resample_filter = bpy.context.scene.TextureBake_Props.resample_filter
+        pixels = resampling.resample(pixels, (width, height), size, resample_filter)
+
+        if encoded:
+            pixels[:, 0:3] = linear_to_srgb(pixels[:, 0:3])
+
+    return pixels
+
+
+def copy_image_pixels(source, name):
+    """Copies the pixels and color space of source into the image called name,
+    which is scaled to the size of source and packed"""
+    image = bpy.data.images[name]
+    image.colorspace_settings.name = source.colorspace_settings.name
+    if tuple(image.size) != tuple(source.size):
+        image.scale(source.size[0], source.size[1])
+    image.pixels.foreach_set(get_image_pixels(source)[:, 0:image.channels].ravel())
+    image.pack()
+
+
+def copy_image(source, target, output="Color"):
+    """Copies the pixels of source into target the way an emission bake of an Image
+    Texture node output would. Returns False if the source can't be copied"""
+    # Float images are always linear, byte images only in these color spaces
+    if not source.is_float and source.colorspace_settings.name not in ["sRGB", "Non-Color", "Linear", "Raw"]:
+        return False
+    if source.size[0] == 0 or source.size[1] == 0:
+        return False
+
+    pixels = get_image_pixels(source, target.size)
+
+    if not source.is_float and source.colorspace_settings.name == "sRGB":
+        pixels[:, 0:3] = srgb_to_linear(pixels[:, 0:3])
+
+    # Emission bakes write the alpha output as gray and are always opaque
+    if output == "Alpha":
+        pixels[:, 0:3] = pixels[:, 3:4]
+    pixels[:, 3] = 1.0
+
+    set_image_pixels(target, pixels)
+    return True
 
 
 def deselect_all_nodes(nodes):
@@ -220,41 +482,58 @@ def deselect_all_nodes(nodes):
 
 
 def find_socket_connected_to_pnode(pnode, thisbake):
+    # Packed scalar bakes combine the sockets of up to three maps into one color
+    if isinstance(thisbake, tuple):
+        nodetree = pnode.id_data
+        combine = nodetree.nodes.new("ShaderNodeCombineRGB")
+        combine.label = "TextureBake"
+        combine.location = pnode.location
+        for i, m in enumerate(thisbake):
+            nodetree.links.new(find_socket_connected_to_pnode(pnode, m), combine.inputs[i])
+        return combine.outputs[0]
+
     socketname = psocketname[thisbake]
     socket = pnode.inputs[socketname]
     return socket.links[0].from_socket
 
 
-def create_dummy_nodes(nodetree, thisbake):
-    for node in nodetree.nodes:
-        if node.type == "BSDF_PRINCIPLED":
-            socketname = psocketname[thisbake]
-            psocket = node.inputs[socketname]
+def create_dummy_nodes(nodetree, thisbake, graph=None):
+    graph = graph or material_analysis.MaterialGraph(nodetree)
+    if isinstance(thisbake, tuple):
+        for m in thisbake:
+            create_dummy_nodes(nodetree, m, graph)
+        return
 
-            # If it has something plugged in, we can leave it here
-            if(len(psocket.links) > 0):
-                continue
+    for name in graph.principled:
+        node = nodetree.nodes[name]
+        socketname = psocketname[thisbake]
+        psocket = node.inputs[socketname]
 
-            # Get value of the unconnected socket
-            val = psocket.default_value
+        # If it has something plugged in, we can leave it here
+        if socketname in graph.linked_sockets[name]:
+            continue
 
-            # If this is base col or ssscol, add an RGB node and set its value to that of the socket
-            if(socketname == "Base Color" or socketname == "Subsurface Color"):
-                rgb = nodetree.nodes.new("ShaderNodeRGB")
-                rgb.outputs[0].default_value = val
-                rgb.label = "TextureBake"
-                nodetree.links.new(rgb.outputs[0], psocket)
+        # Get value of the unconnected socket
+        val = psocket.default_value
 
-            # If this is anything else, use a value node
-            else:
-                vnode = nodetree.nodes.new("ShaderNodeValue")
-                vnode.outputs[0].default_value = val
-                vnode.label = "TextureBake"
-                nodetree.links.new(vnode.outputs[0], psocket)
+        # If this is base col or ssscol, add an RGB node and set its value to that of the socket
+        if(socketname == "Base Color" or socketname == "Subsurface Color"):
+            rgb = nodetree.nodes.new("ShaderNodeRGB")
+            rgb.outputs[0].default_value = val
+            rgb.label = "TextureBake"
+            nodetree.links.new(rgb.outputs[0], psocket)
+
+        # If this is anything else, use a value node
+        else:
+            vnode = nodetree.nodes.new("ShaderNodeValue")
+            vnode.outputs[0].default_value = val
+            vnode.label = "TextureBake"
+            nodetree.links.new(vnode.outputs[0], psocket)
 
 
-def bake_operation(thisbake, img):
+def bake_operation(thisbake, *images):
     print_msg(f"Beginning bake for {thisbake}")
+    report_map_started(thisbake, images[0].name)
 
     use_clear = False
     if thisbake not in [constants.PBR_NORMAL_DX, constants.PBR_NORMAL_OGL]:
@@ -262,14 +541,20 @@ def bake_operation(thisbake, img):
     else:
         bpy.ops.object.bake(type="NORMAL", save_mode="INTERNAL", use_clear=use_clear)
 
-    # Always pack the image for now
-    img.pack()
+    # Always pack the images for now. Tiled images are split into
+    # one image per tile after the bake and packed then
+    for img in images:
+        if img.source != "TILED":
+            img.pack()
 
 
 def check_scene(objects, bakemode):
     messages = []
     props = bpy.context.scene.TextureBake_Props
 
+    # A new bake starts here, materials may have been edited since the last one
+    material_analysis.clear_material_graphs()
+
     # Are objects selected for baking?
     if props.use_object_list:
         objects = advanced_object_selection_to_list()
@@ -447,33 +732,6 @@ def process_uvs():
                 obj.data.uv_layers["TextureBake"].active = True
 
 
-def find_pnode(nodetree):
-    nodes = nodetree.nodes
-    for node in nodes:
-        if(node.type == "BSDF_PRINCIPLED"):
-            return node
-    # We never found it
-    return False
-
-
-def find_enode(nodetree):
-    nodes = nodetree.nodes
-    for node in nodes:
-        if(node.type == "EMISSION"):
-            return node
-    # We never found it
-    return False
-
-
-def find_mnode(nodetree):
-    nodes = nodetree.nodes
-    for node in nodes:
-        if(node.type == "MIX_SHADER"):
-            return node
-    # We never found it
-    return False
-
-
 def find_onode(nodetree):
     nodes = nodetree.nodes
     for node in nodes:
@@ -510,16 +768,6 @@ def get_export_folder_name(initialise = False, relative = False):
     return folder
 
 
-def get_mat_type(nodetree):
-    if (find_pnode(nodetree) and find_mnode(nodetree)):
-        return "MIX"
-    elif(find_pnode(nodetree)):
-        return "PURE_P"
-    elif(find_enode(nodetree)):
-        return "PURE_E"
-    return "INVALID"
-
-
 def clean_file_name(filename):
     keepcharacters = (' ','.','_','~',"-")
     return "".join(c for c in filename if c.isalnum() or c in keepcharacters).rstrip()
@@ -673,7 +921,7 @@ def export_textures(image, baketype, obj):
             counter = int(image.name[-3:])
             imgrootname = image.name[0:-4]
             while counter > 0:
-                bpy.data.images.remove(bpy.data.images[f"{imgrootname}{1000+ counter}"])
+                remove_image(bpy.data.images[f"{imgrootname}{1000+ counter}"])
                 counter = counter - 1
 
             # Get the current (final) UDIM number
@@ -682,7 +930,7 @@ def export_textures(image, baketype, obj):
             # There can only be one!
             prposed_img_name = savepath.parts[-1].replace(imgudimnum, "1001")
             if prposed_img_name in bpy.data.images:
-                bpy.data.images.remove(bpy.data.images[prposed_img_name])
+                remove_image(bpy.data.images[prposed_img_name])
 
             # Open the UDIM image
             bpy.ops.image.open(filepath=str(savepath).replace(imgudimnum, "1001"), directory= str(get_export_folder_name()) + "/", use_udim_detecting=True, relative_path=True)
@@ -695,6 +943,7 @@ def export_textures(image, baketype, obj):
             image["SB_thisbake"] = SB_thisbake
             image["SB_merged_bake_name"] = SB_merged_bake_name
             image["SB_udims"] = SB_udims
+            BakedImages.add(image)
 
     # Col management
     if file_extension == "exr":
@@ -711,13 +960,22 @@ def select_only_this(obj):
     bpy.context.view_layer.objects.active = obj
 
 
-def setup_pure_p_material(nodetree, thisbake):
+def select_only_these(objects):
+    bpy.ops.object.select_all(action="DESELECT")
+    for obj in objects:
+        obj.select_set(state=True)
+    bpy.context.view_layer.objects.active = objects[0]
+
+
+def setup_pure_p_material(nodetree, thisbake, graph=None):
+    graph = graph or material_analysis.MaterialGraph(nodetree)
+
     # Create dummy nodes as needed
-    create_dummy_nodes(nodetree, thisbake)
+    create_dummy_nodes(nodetree, thisbake, graph)
 
     # Create emission shader
     nodes = nodetree.nodes
-    m_output_node = find_onode(nodetree)
+    m_output_node = nodes[graph.output]
     loc = m_output_node.location
 
     # Create an emission shader
@@ -732,108 +990,90 @@ def setup_pure_p_material(nodetree, thisbake):
     nodetree.links.new(fromsocket, tosocket)
 
     # Connect whatever is in Principled Shader for this bakemode to the emission
-    fromsocket = find_socket_connected_to_pnode(find_pnode(nodetree), thisbake)
+    fromsocket = find_socket_connected_to_pnode(nodes[graph.principled[0]], thisbake)
     tosocket = emissnode.inputs[0]
     nodetree.links.new(fromsocket, tosocket)
 
 
-def setup_pure_e_material(nodetree, thisbake):
+def setup_pure_e_material(nodetree, thisbake, graph=None):
+    graph = graph or material_analysis.MaterialGraph(nodetree)
+
     # If baking something other than emission, mute the emission modes so they don't contaiminate our bake
     if thisbake != "Emission":
-        for node in nodetree.nodes:
-            if node.type == "EMISSION":
-                node.mute = True
-                node.label = "TextureBakeMuted"
+        for name in graph.emission:
+            node = nodetree.nodes[name]
+            node.mute = True
+            node.label = "TextureBakeMuted"
 
 
-def setup_mix_material(nodetree, thisbake):
+def setup_mix_material(nodetree, thisbake, graph=None):
     # No need to mute emission nodes. They are automuted by setting the RGBMix to black
     nodes = nodetree.nodes
+    graph = graph or material_analysis.MaterialGraph(nodetree)
 
     # Create dummy nodes as needed
-    create_dummy_nodes(nodetree, thisbake)
+    create_dummy_nodes(nodetree, thisbake, graph)
 
     # For every mix shader, create a mixrgb above it
     # Also connect the factor input to the same thing
     created_mix_nodes = {}
-    for node in nodes:
-        if node.type == "MIX_SHADER":
-            loc = node.location
-            rgbmix = nodetree.nodes.new("ShaderNodeMixRGB")
-            rgbmix.label = "TextureBake"
-            rgbmix.location = loc
-            rgbmix.location.y = rgbmix.location.y + 200
-
-            # If there is one, plug the factor from the original mix node into our new mix node
-            if(len(node.inputs[0].links) > 0):
-                fromsocket = node.inputs[0].links[0].from_socket
-                tosocket = rgbmix.inputs["Fac"]
-                nodetree.links.new(fromsocket, tosocket)
-            # If no input, add a value node set to same as the mnode factor
-            else:
-                val = node.inputs[0].default_value
-                vnode = nodes.new("ShaderNodeValue")
-                vnode.label = "TextureBake"
-                vnode.outputs[0].default_value = val
+    for name in graph.mix_shaders:
+        node = nodes[name]
+        loc = node.location
+        rgbmix = nodetree.nodes.new("ShaderNodeMixRGB")
+        rgbmix.label = "TextureBake"
+        rgbmix.location = loc
+        rgbmix.location.y = rgbmix.location.y + 200
+
+        # If there is one, plug the factor from the original mix node into our new mix node
+        if(len(node.inputs[0].links) > 0):
+            fromsocket = node.inputs[0].links[0].from_socket
+            tosocket = rgbmix.inputs["Fac"]
+            nodetree.links.new(fromsocket, tosocket)
+        # If no input, add a value node set to same as the mnode factor
+        else:
+            val = node.inputs[0].default_value
+            vnode = nodes.new("ShaderNodeValue")
+            vnode.label = "TextureBake"
+            vnode.outputs[0].default_value = val
 
-                fromsocket = vnode.outputs[0]
-                tosocket = rgbmix.inputs[0]
-                nodetree.links.new(fromsocket, tosocket)
+            fromsocket = vnode.outputs[0]
+            tosocket = rgbmix.inputs[0]
+            nodetree.links.new(fromsocket, tosocket)
 
-            # Keep a dictionary with paired shader mix node
-            created_mix_nodes[node.name] = rgbmix.name
+        # Keep a dictionary with paired shader mix node
+        created_mix_nodes[node.name] = rgbmix.name
 
     # Loop over the RGBMix nodes that we created
     for node in created_mix_nodes:
-        mshader = nodes[node]
         rgb = nodes[created_mix_nodes[node]]
 
-        # Mshader - Socket 1
-        # First, check if there is anything plugged in at all
-        if len(mshader.inputs[1].links) > 0:
-            fromnode = mshader.inputs[1].links[0].from_node
-
-            if fromnode.type == "BSDF_PRINCIPLED":
-                # Get the socket we are looking for, and plug it into RGB socket 1
-                fromsocket = find_socket_connected_to_pnode(fromnode, thisbake)
-                nodetree.links.new(fromsocket, rgb.inputs[1])
-            elif fromnode.type == "MIX_SHADER":
-                # If it's a mix shader on the other end, connect the equivilent RGB node
-                # Get the RGB node for that mshader
-                fromrgb = nodes[created_mix_nodes[fromnode.name]]
-                fromsocket = fromrgb.outputs[0]
-                nodetree.links.new(fromsocket, rgb.inputs[1])
-            elif fromnode.type == "EMISSION":
-                # Set this input to black
-                rgb.inputs[1].default_value = (0.0, 0.0, 0.0, 1)
-            else:
-                print_msg("Error, invalid node config")
-        else:
-            rgb.inputs[1].default_value = (0.0, 0.0, 0.0, 1)
+        # Mshader - Socket 1 and 2
+        for i, fromname in enumerate(graph.mix_inputs[node], 1):
+            # First, check if there is anything plugged in at all
+            if fromname is None:
+                rgb.inputs[i].default_value = (0.0, 0.0, 0.0, 1)
+                continue
 
-        # Mshader - Socket 2
-        if len(mshader.inputs[2].links) > 0:
-            fromnode = mshader.inputs[2].links[0].from_node
+            fromnode = nodes[fromname]
             if fromnode.type == "BSDF_PRINCIPLED":
-                # Get the socket we are looking for, and plug it into RGB socket 2
+                # Get the socket we are looking for, and plug it into the RGB socket
                 fromsocket = find_socket_connected_to_pnode(fromnode, thisbake)
-                nodetree.links.new(fromsocket, rgb.inputs[2])
+                nodetree.links.new(fromsocket, rgb.inputs[i])
             elif fromnode.type == "MIX_SHADER":
                 # If it's a mix shader on the other end, connect the equivilent RGB node
                 # Get the RGB node for that mshader
                 fromrgb = nodes[created_mix_nodes[fromnode.name]]
                 fromsocket = fromrgb.outputs[0]
-                nodetree.links.new(fromsocket, rgb.inputs[2])
+                nodetree.links.new(fromsocket, rgb.inputs[i])
             elif fromnode.type == "EMISSION":
                 # Set this input to black
-                rgb.inputs[2].default_value = (0.0, 0.0, 0.0, 1)
+                rgb.inputs[i].default_value = (0.0, 0.0, 0.0, 1)
             else:
-                print_msg("Error, invalid node config")
-        else:
-            rgb.inputs[2].default_value = (0.0, 0.0, 0.0, 1)
+                print_error("Invalid node config")
 
     # Find the output node with location
-    m_output_node = find_onode(nodetree)
+    m_output_node = nodes[graph.output]
     loc = m_output_node.location
 
     # Create an emission shader
@@ -843,8 +1083,7 @@ def setup_mix_material(nodetree, thisbake):
     emissnode.location.y = emissnode.location.y + 200
 
     # Get the original mix node that was connected to the output node
-    socket = m_output_node.inputs["Surface"]
-    fromnode = socket.links[0].from_node
+    fromnode = nodes[graph.surface]
 
     # Find our created mix node that is paired with it
     rgbmix = nodes[created_mix_nodes[fromnode.name]]
@@ -856,28 +1095,39 @@ def setup_mix_material(nodetree, thisbake):
     nodetree.links.new(emissnode.outputs[0], m_output_node.inputs[0])
 
 
+def reset_material_nodes(nodetree, graph):
+    """Undoes the setup of a prepared duplicate for its previous map. The nodes
+    added for baking are removed, muted nodes are unmuted and the original
+    surface shader is linked to the material output again"""
+    nodes = nodetree.nodes
+    for node in list(nodes):
+        if node.label == "TextureBake" and node.type != "TEX_IMAGE":
+            nodes.remove(node)
+        elif node.label == "TextureBakeMuted":
+            node.mute = False
+            node.label = ""
+
+    if graph.surface and graph.output:
+        nodetree.links.new(nodes[graph.surface].outputs[graph.surface_output], nodes[graph.output].inputs[0])
+
+
 # ----------------Specials---------------------------------
 def import_needed_specials_materials():
     ordered_specials = []
-    path = os.path.dirname(__file__) + "/materials/materials.blend\\Material\\"
     if bpy.context.scene.TextureBake_Props.selected_thickness:
-        if "TextureBake_" + constants.TEX_THICKNESS not in bpy.data.materials:
-            material_name = "TextureBake_" + constants.TEX_THICKNESS
-            bpy.ops.wm.append(filename=material_name, directory=path)
         ordered_specials.append(constants.TEX_THICKNESS)
-
     if bpy.context.scene.TextureBake_Props.selected_ao:
-        if "TextureBake_" + constants.TEX_AO not in bpy.data.materials:
-            material_name = "TextureBake_" + constants.TEX_AO
-            bpy.ops.wm.append(filename=material_name, directory=path)
         ordered_specials.append(constants.TEX_AO)
-
     if bpy.context.scene.TextureBake_Props.selected_curvature:
-        if "TextureBake" + constants.TEX_CURVATURE not in bpy.data.materials:
-            material_name = "TextureBake_" + constants.TEX_CURVATURE
-            bpy.ops.wm.append(filename=material_name, directory=path)
         ordered_specials.append(constants.TEX_CURVATURE)
 
+    # Append all missing materials with one read of the template file
+    missing = [f"TextureBake_{special}" for special in ordered_specials if f"TextureBake_{special}" not in bpy.data.materials]
+    if missing:
+        path = os.path.join(os.path.dirname(__file__), "materials", "materials.blend")
+        with bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+            data_to.materials = [name for name in missing if name in data_from.materials]
+
     return ordered_specials
 
 
@@ -924,94 +1174,105 @@ def show_message_box(messageitems_list, title, icon = 'INFO'):
     bpy.context.window_manager.popup_menu(draw, title = title, icon = icon)
 
 
-def write_bake_progress(current_operation, total_operations):
-    progress = int((current_operation / total_operations) * 100)
-    t = Path(tempfile.gettempdir())
-    t = t / f"TextureBake_propgress_{os.getpid()}"
-    with open(str(t), "w") as progfile:
-        progfile.write(str(progress))
+# Set by persistent bake workers, which run many bake jobs in one process
+bake_job_id = None
+def get_bake_job_id():
+    if bake_job_id:
+        return bake_job_id
+    return str(os.getpid())
+
+
+# Marks lines on stdout that the parent process reads as bake events
+BAKE_EVENT_PREFIX = "TEXTUREBAKE_EVENT "
+def emit_bake_event(event_type, **data):
+    """Sends an event to the process that started this bake. Events are
+    JSON objects written to stdout on a single line"""
+    data["job"] = get_bake_job_id()
+    data["type"] = event_type
+    print(BAKE_EVENT_PREFIX + json.dumps(data), flush=True)
+
+
+def get_image_size_in_bytes(img):
+    if img.packed_file:
+        return img.packed_file.size
+    return img.size[0] * img.size[1] * img.channels * (4 if img.is_float else 1) * len(img.tiles)
+
+
+def report_map_started(thisbake, image_name, method="bake"):
+    # The method tells bakes apart from maps that are filled or copied without Cycles
+    BakeStatus.map_start_time = time.perf_counter()
+    BakeStatus.map_method = method
+    emit_bake_event("map_started", map=thisbake, image=image_name, method=method)
+
+
+def report_map_finished(thisbake, image_name):
+    # Objects baked together in one render share its time. Attributing all of it
+    # to the first one keeps the sum of the reported times correct
+    now = time.perf_counter()
+    seconds = now - BakeStatus.map_start_time
+    BakeStatus.map_start_time = now
+
+    # Packed scalar bakes count as one bake per map, their textures are
+    # reported once the packed image has been split
+    maps = thisbake if isinstance(thisbake, tuple) else (thisbake,)
+    img = bpy.data.images[image_name]
+    for m in maps:
+        BakeStatus.current_map += 1
+        print_msg(f"Bake maps {BakeStatus.current_map} of {BakeStatus.total_maps} complete")
+
+        emit_bake_event("map_finished",
+            map=m,
+            image=image_name,
+            seconds=seconds / len(maps),
+            method=BakeStatus.map_method,
+            bytes=get_image_size_in_bytes(img),
+            width=img.size[0],
+            height=img.size[1],
+            tiles=len(img.tiles),
+            current=BakeStatus.current_map,
+            total=BakeStatus.total_maps,
+        )
+
+    if not isinstance(thisbake, tuple):
+        write_baked_texture(image_name)
 
 
 def write_baked_texture(texture_name):
-    t = Path(tempfile.gettempdir())
-    t = t / f"TextureBake_bakes_{os.getpid()}"
-    with open(str(t), "a") as progfile:
-        progfile.write(f"{texture_name}\n")
-
-
-def read_baked_textures(pid):
-    textures = []
-    t = Path(tempfile.gettempdir()) / f"TextureBake_bakes_{str(pid)}"
-    with open(str(t), "r") as texfile:
-        textures = texfile.readlines()
-        textures = [tex.rstrip() for tex in textures]
-    return list(dict.fromkeys(textures))
-
-
-# Dict obj name to tile
-currentUDIMtile = {}
-def focus_UDIM_tile(obj,desiredUDIMtile):
-    global currentUDIMtile
+    emit_bake_event("texture", name=texture_name)
 
-    select_only_this(obj)
-    bpy.ops.object.editmode_toggle()
 
-    print_msg(f"Shifting UDIM focus tile: Object: {obj.name} Tile: {desiredUDIMtile}")
-
-    import bmesh
-    if obj.name not in currentUDIMtile:
-        # Must be first time. Set to 0
-        currentUDIMtile[obj.name] = 0
+def focus_UDIM_tile(obj, desiredUDIMtile):
+    """Moves the UVs of the given UDIM tile into 0-1 UV space"""
+    # Focus tiles are tracked per mesh, objects sharing a mesh share its UVs
+    focus_tiles = MasterOperation.bake_op.udim_focus_tiles
+    me = obj.data
 
     # Difference between desired and current
-    tilediff =  desiredUDIMtile - currentUDIMtile[obj.name]
+    tilediff = desiredUDIMtile - focus_tiles.get(me.name, 0)
+    if tilediff == 0 or not me.uv_layers.active:
+        return
 
-    me = obj.data
-    bm = bmesh.new()
-    bm = bmesh.from_edit_mesh(me)
-    uv_layer = bm.loops.layers.uv.verify()
+    print_msg(f"Shifting UDIM focus tile: Object: {obj.name} Tile: {desiredUDIMtile}")
 
-    # scale UVs x2
-    for f in bm.faces:
-        for l in f.loops:
-            l[uv_layer].uv[0] -= tilediff
+    uv_data = me.uv_layers.active.data
+    uvs = np.empty(len(uv_data) * 2, dtype=np.float32)
+    uv_data.foreach_get("uv", uvs)
+    uvs[0::2] -= tilediff
+    uv_data.foreach_set("uv", uvs)
 
     me.update()
-    currentUDIMtile[obj.name] = desiredUDIMtile
-    bpy.ops.object.editmode_toggle()
+    focus_tiles[me.name] = desiredUDIMtile
 
 
 def check_for_connected_viewer_node(mat):
     mat.use_nodes = True
-    node_tree = mat.node_tree
-    nodes = node_tree.nodes
-    onode = find_onode(node_tree)
-
-    # Get all nodes with label "Viewer"
-    viewer_nodes = [n for n in nodes if n.label == "Viewer"]
-
-    # Check if any of those viewer nodes are connected to the Material Output
-    for n in viewer_nodes:
-        if n.name == onode.inputs[0].links[0].from_node.name:
-            return True
-
-    return False
+    # Check if a viewer node is connected to the Material Output
+    return material_analysis.get_material_graph(mat).viewer_connected
 
 
 def check_mats_valid_for_pbr(mat):
-    nodes = mat.node_tree.nodes
-
-    valid = True
-    invalid_node_names = []
-
-    for node in nodes:
-        if len(node.outputs) > 0:
-            if node.outputs[0].type == "SHADER" and not (node.bl_idname == "ShaderNodeBsdfPrincipled" or node.bl_idname == "ShaderNodeMixShader" or node.bl_idname == "ShaderNodeEmission"):
-                # But is it actually connected to anything?
-                if len(node.outputs[0].links) >0:
-                    invalid_node_names.append(node.name)
-
-    return invalid_node_names
+    # Only shaders that end up in the material output matter
+    return list(material_analysis.get_material_graph(mat).invalid_shaders)
 
 
 def advanced_object_selection_to_list():
@@ -1029,7 +1290,30 @@ def scale_image_if_needed(img):
     proposed_height = bpy.context.scene.TextureBake_Props.output_height
 
     if width != proposed_width or height != proposed_height:
-        img.scale(proposed_width, proposed_height)
+        pixels = get_image_pixels(img, (proposed_width, proposed_height))
+        if img.get("SB_thisbake") in [constants.PBR_NORMAL_OGL, constants.PBR_NORMAL_DX]:
+            resampling.normalize_vectors(pixels)
+
+        # A new image gets a buffer of the output size without resampling it a second
+        # time like img.scale would. It takes over the name, tags and users of img
+        scaled = bpy.data.images.new(img.name + "_scaled", proposed_width, proposed_height, alpha=True, float_buffer=img.is_float)
+        scaled.colorspace_settings.name = img.colorspace_settings.name
+        scaled.alpha_mode = img.alpha_mode
+        scaled.use_fake_user = img.use_fake_user
+        for key in img.keys():
+            scaled[key] = img[key]
+        scaled.pixels.foreach_set(pixels[:, 0:scaled.channels].ravel())
+        scaled.pack()
+
+        name = img.name
+        is_result = img in MasterOperation.baked_textures
+        img.user_remap(scaled)
+        remove_image(img)
+        scaled.name = name
+        if is_result:
+            MasterOperation.baked_textures.append(scaled)
+        if "SB_objname" in scaled:
+            BakedImages.add(scaled)
 
 
 def set_image_internal_col_space(image, thisbake):
@@ -1114,5 +1398,7 @@ def replace_image(old_img, new_img):
                 for node in traverse(mat.node_tree, old_name):
                     node.image = new_img
 
-    bpy.data.images.remove(old_img)
+    remove_image(old_img)
     new_img.name = old_name
+    if "SB_objname" in new_img:
+        BakedImages.add(new_img)
@@ -0,0 +1,186 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+import numpy as np
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import functions
+
+
+class encoder_threads():
+    # Shared by all encodes, zlib releases the GIL while it compresses
+    executor = None
+
+
+# Rows are deflated in chunks of at least this many bytes
+min_chunk_size = 1 << 20
+
+
+def get_executor():
+    if encoder_threads.executor is None:
+        encoder_threads.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="TextureBakeEncode")
+    return encoder_threads.executor
+
+
+def quantize(pixels, width, height, bit_depth, flip=True):
+    """Converts float pixels with rows from bottom to top into integers. Rows are
+    flipped to go from top to bottom, the order most image files use"""
+    pixels = np.clip(pixels.reshape(height, width, -1), 0.0, 1.0)
+    if flip:
+        pixels = pixels[::-1]
+    if bit_depth == 16:
+        return (pixels * 65535.0 + 0.5).astype(">u2")
+    return (pixels * 255.0 + 0.5).astype(np.uint8)
+
+
+def ranges(counts):
+    """Returns 0..n-1 for every n in counts, concatenated"""
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+
+
+def png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk) & 0xffffffff)
+
+
+def png_filter(rows, bytes_per_pixel, level):
+    """Prefixes every row with its filter type. Compressed images use the Sub
+    filter, which stores the difference to the previous pixel in the row"""
+    raw = np.zeros((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    raw[:, 1:] = rows
+    if level > 0:
+        raw[:, 0] = 1
+        raw[:, 1 + bytes_per_pixel:] -= rows[:, :-bytes_per_pixel]
+    return raw
+
+
+def deflate_chunk(data, level, last):
+    """Compresses part of a zlib stream. All but the last chunk end on a byte
+    boundary without closing the stream, so the chunks can be concatenated"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def parallel_deflate(raw, level):
+    """Compresses the rows of an image into a zlib stream on several threads"""
+    num_chunks = max(1, min(os.cpu_count() or 1, raw.nbytes // min_chunk_size, raw.shape[0]))
+    chunks = [c.tobytes() for c in np.array_split(raw, num_chunks)]
+    futures = [get_executor().submit(deflate_chunk, c, level, i == len(chunks) - 1) for i, c in enumerate(chunks)]
+
+    # The header announces the compression level, the checksum covers all chunks
+    flevel = 0 if level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+    header = struct.pack(">BB", 0x78, (flevel << 6) + 31 - ((0x78 << 8) + (flevel << 6)) % 31)
+    checksum = 1
+    for c in chunks:
+        checksum = zlib.adler32(c, checksum)
+
+    return b"".join([header] + [f.result() for f in futures] + [struct.pack(">I", checksum & 0xffffffff)])
+
+
+def encode_png(pixels, width, height, bit_depth=8, compression=6):
+    """Encodes RGBA pixels as a PNG file with the given zlib level and returns its bytes"""
+    data = quantize(pixels, width, height, bit_depth)
+    rows = data.view(np.uint8).reshape(height, -1)
+    raw = png_filter(rows, 4 * bit_depth // 8, compression)
+
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, 6, 0, 0, 0)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        png_chunk(b"IHDR", header),
+        png_chunk(b"IDAT", parallel_deflate(raw, compression)),
+        png_chunk(b"IEND", b""),
+    ])
+
+
+def encode_tga(pixels, width, height, bit_depth=8, compression=6):
+    """Encodes RGBA pixels as a run-length encoded 32-bit TGA file and returns its
+    bytes. TGA is always 8-bit and has no compression levels"""
+    # TGA stores BGRA with rows from bottom to top, same as Blender
+    bgra = quantize(pixels, width, height, 8, flip=False)[..., [2, 1, 0, 3]].reshape(-1, 4)
+    flat = np.ascontiguousarray(bgra).view(np.uint32).ravel()
+
+    # Runs of equal pixels, packets never cross rows
+    new_run = np.ones(flat.size, dtype=bool)
+    new_run[1:] = flat[1:] != flat[:-1]
+    new_run[::width] = True
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.append(run_starts, flat.size))
+
+    # A packet holds at most 128 pixels, longer runs are split up
+    pieces = (run_lengths + 127) // 128
+    offsets = ranges(pieces) * 128
+    piece_starts = np.repeat(run_starts, pieces) + offsets
+    piece_lengths = np.minimum(np.repeat(run_lengths, pieces) - offsets, 128)
+
+    # Single pixels are grouped into raw packets of up to 128 pixels
+    is_run = piece_lengths > 1
+    breaks = is_run.copy()
+    breaks[0] = True
+    breaks[1:] |= is_run[:-1] | (piece_starts[1:] % width == 0)
+    index = np.arange(breaks.size)
+    group_starts = np.maximum.accumulate(np.where(breaks, index, 0))
+    packet_flags = breaks | ((index - group_starts) % 128 == 0)
+
+    first = np.flatnonzero(packet_flags)
+    packet_is_run = is_run[first]
+    packet_sizes = np.diff(np.append(first, breaks.size))
+    headers = np.where(packet_is_run, 0x80 | (piece_lengths[first] - 1), packet_sizes - 1).astype(np.uint8)
+    num_pixels = np.where(packet_is_run, 1, packet_sizes)
+
+    # Interleave the packet headers with the pixels they store
+    pixel_index = np.repeat(piece_starts[first], num_pixels) + ranges(num_pixels)
+    packet_bytes = 1 + 4 * num_pixels
+    header_offsets = np.cumsum(packet_bytes) - packet_bytes
+    data = np.empty(packet_bytes.sum(), dtype=np.uint8)
+    is_pixel = np.ones(data.size, dtype=bool)
+    is_pixel[header_offsets] = False
+    data[header_offsets] = headers
+    data[is_pixel] = bgra[pixel_index].ravel()
+
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, 10, 0, 0, 0, 0, 0, width, height, 32, 8)
+    return header + data.tobytes()
+
+
+# Encoders by Blender file format name
+encoders = {
+    "PNG": encode_png,
+    "TARGA": encode_tga,
+}
+
+
+def can_encode(file_format, bit_depth):
+    if file_format == "TARGA":
+        return True
+    return file_format in encoders and bit_depth in [8, 16]
+
+
+def prepare_pixels(pixels, file_format):
+    """Applies the standard sRGB view transform that Blender uses when saving
+    renders to all formats but EXR. Returns a new array"""
+    pixels = pixels.copy()
+    pixels[:, 0:3] = functions.linear_to_srgb(pixels[:, 0:3])
+    return pixels
+
+
+def encode(pixels, width, height, file_format, bit_depth=8, compression=6):
+    """Encodes linear RGBA float pixels with the encoder for the given format"""
+    return encoders[file_format](prepare_pixels(pixels, file_format), width, height, bit_depth, compression)
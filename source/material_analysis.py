@@ -0,0 +1,377 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import bpy
+import hashlib
+
+from . import (
+    constants,
+    functions,
+)
+
+
+class material_graphs():
+    # MaterialGraph by material name and node tree revision
+    graphs = {}
+
+
+# Maps that don't come from a Principled BSDF input and can't be constant
+non_constant_maps = [
+    constants.PBR_AO,
+    constants.PBR_EMISSION,
+    constants.PBR_NORMAL_DX,
+    constants.PBR_NORMAL_OGL,
+]
+
+
+def find_output_node(nodetree):
+    """Returns the output node that Cycles renders the material with"""
+    outputs = [node for node in nodetree.nodes if node.type == "OUTPUT_MATERIAL"]
+    for node in outputs:
+        if node.is_active_output:
+            return node
+    return outputs[0] if outputs else None
+
+
+def get_reachable_nodes(nodetree):
+    """Returns the nodes that the active material output depends on, including the
+    output itself. The links are walked backwards once from the output"""
+    output = find_output_node(nodetree)
+    if not output:
+        return []
+
+    # Nodes linked into each node, by the name of the node they lead to
+    inputs = {}
+    for link in nodetree.links:
+        inputs.setdefault(link.to_node.name, []).append(link.from_node)
+
+    reachable = {output.name: output}
+    stack = [output]
+    while stack:
+        node = stack.pop()
+        for from_node in inputs.get(node.name, []):
+            if from_node.name not in reachable:
+                reachable[from_node.name] = from_node
+                stack.append(from_node)
+
+    return list(reachable.values())
+
+
+def get_rna_key(value, depth=0):
+    """Returns a comparable summary of an RNA value. Data-blocks are summed up
+    by name, other structs by the values of their properties"""
+    if isinstance(value, bpy.types.ID):
+        return value.name_full
+
+    # Curves and color ramps keep their points too deep for the generic walk
+    if isinstance(value, bpy.types.CurveMapping):
+        curves = tuple(tuple((tuple(p.location), p.handle_type) for p in curve.points) for curve in value.curves)
+        clip = (value.use_clip, value.clip_min_x, value.clip_min_y, value.clip_max_x, value.clip_max_y)
+        return (curves, clip, tuple(value.black_level), tuple(value.white_level))
+    if isinstance(value, bpy.types.ColorRamp):
+        elements = tuple((e.position, tuple(e.color)) for e in value.elements)
+        return (elements, value.color_mode, value.interpolation, value.hue_interpolation)
+
+    if isinstance(value, bpy.types.bpy_struct):
+        # Deeper levels only lead back into the node tree
+        if depth > 3:
+            return None
+        return tuple(get_rna_key(getattr(value, prop.identifier), depth + 1) for prop in value.bl_rna.properties if prop.identifier != "rna_type")
+    if isinstance(value, (str, bool, int, float)) or value is None:
+        return value
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    return tuple(get_rna_key(v, depth + 1) for v in value)
+
+
+def get_tree_fingerprint(nodetree):
+    """Returns a hash of everything in a node tree that changes how it renders:
+    node types and settings, socket values, links and the images and node
+    groups it uses. Names, locations and other layout details are left out,
+    so separate copies of the same material have the same fingerprint"""
+    # Properties that every node has, only few of them matter for rendering
+    common = {prop.identifier for prop in bpy.types.ShaderNode.bl_rna.properties}
+    index = {node.name: i for i, node in enumerate(nodetree.nodes)}
+
+    items = []
+    for node in nodetree.nodes:
+        items.append((node.bl_idname, node.mute))
+        items.append(tuple(get_rna_key(getattr(node, prop.identifier)) for prop in node.bl_rna.properties if prop.identifier not in common))
+        for socket in list(node.inputs) + list(node.outputs):
+            if hasattr(socket, "default_value"):
+                items.append((socket.identifier, get_rna_key(socket.default_value)))
+
+    for link in nodetree.links:
+        items.append((index[link.from_node.name], link.from_socket.identifier, index[link.to_node.name], link.to_socket.identifier, link.is_muted))
+
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+class MaterialGraph:
+    """The structure of a material node tree that matters for baking. Nodes are
+    stored by name, so the graph also describes copies of the material"""
+    def __init__(self, nodetree):
+        output = find_output_node(nodetree)
+        reachable = get_reachable_nodes(nodetree)
+        names = {node.name for node in reachable}
+
+        self.output = output.name if output else None
+
+        # Shader nodes that don't lead to the output
+        self.unused = [node.name for node in nodetree.nodes if node.type in ["BSDF_PRINCIPLED", "EMISSION", "MIX_SHADER"] and node.name not in names]
+
+        self.principled = [node.name for node in reachable if node.type == "BSDF_PRINCIPLED"]
+        self.emission = [node.name for node in reachable if node.type == "EMISSION"]
+        self.mix_shaders = [node.name for node in reachable if node.type == "MIX_SHADER"]
+
+        # Names of the linked inputs of every Principled BSDF
+        self.linked_sockets = {}
+        for node in reachable:
+            if node.type == "BSDF_PRINCIPLED":
+                self.linked_sockets[node.name] = {socket.name for socket in node.inputs if socket.is_linked}
+
+        # Node linked into each shader input of every mix shader, or None
+        self.mix_inputs = {}
+        for node in reachable:
+            if node.type == "MIX_SHADER":
+                self.mix_inputs[node.name] = [s.links[0].from_node.name if s.is_linked else None for s in node.inputs[1:3]]
+
+        # Shaders that end up in the material output but can't be baked
+        self.invalid_shaders = [node.name for node in reachable if len(node.outputs) > 0 and node.outputs[0].type == "SHADER" and \
+            node.bl_idname not in ["ShaderNodeBsdfPrincipled", "ShaderNodeMixShader", "ShaderNodeEmission"]]
+
+        # Node and output index linked into the surface of the material output
+        self.surface = None
+        self.surface_output = 0
+        if output and output.inputs[0].is_linked:
+            link = output.inputs[0].links[0]
+            self.surface = link.from_node.name
+            self.surface_output = list(link.from_node.outputs).index(link.from_socket)
+        self.viewer_connected = self.surface is not None and nodetree.nodes[self.surface].label == "Viewer"
+
+        # Only needed to share duplicates, set by get_material_fingerprint
+        self.fingerprint = None
+
+        if self.principled and self.mix_shaders:
+            self.mat_type = "MIX"
+        elif self.principled:
+            self.mat_type = "PURE_P"
+        elif self.emission:
+            self.mat_type = "PURE_E"
+        else:
+            self.mat_type = "INVALID"
+
+
+def get_tree_revision(nodetree):
+    """Returns a cheap summary of a node tree that changes with most edits"""
+    return (len(nodetree.nodes), len(nodetree.links))
+
+
+def get_source_material(mat):
+    """Returns the material that a duplicate made for baking was copied from, or
+    the material itself if it isn't a duplicate"""
+    if mat is None:
+        return None
+    return bpy.data.materials.get(mat.get("SB_dupmat", ""), mat)
+
+
+def get_material_graph(mat):
+    """Returns the graph of a material. Duplicates made for baking share the
+    graph of the material they were copied from, which is only analysed once"""
+    source = get_source_material(mat)
+
+    # Duplicates of duplicates have been modified, as have materials without nodes
+    if "SB_dupmat" in source or not source.node_tree:
+        return MaterialGraph(mat.node_tree)
+
+    key = (source.name, get_tree_revision(source.node_tree))
+    graph = material_graphs.graphs.get(key)
+    if graph is None:
+        graph = MaterialGraph(source.node_tree)
+        material_graphs.graphs[key] = graph
+    return graph
+
+
+def get_material_fingerprint(mat):
+    """Returns a key that is the same for materials with identical node trees.
+    Materials without a node tree are only equal to themselves"""
+    source = get_source_material(mat)
+    if not source.node_tree:
+        return source.name
+
+    graph = get_material_graph(source)
+    if graph.fingerprint is None:
+        graph.fingerprint = get_tree_fingerprint(source.node_tree)
+    return graph.fingerprint
+
+
+def clear_material_graphs():
+    """Forgets all analysed materials. Has to be called when a new bake starts"""
+    material_graphs.graphs = {}
+
+
+def get_socket_constant(socket):
+    """Returns the value of an input socket as RGBA if it doesn't vary across the surface, otherwise None"""
+    if socket.is_linked:
+        link = socket.links[0]
+        if link.from_node.type == "VALUE":
+            value = link.from_node.outputs[0].default_value
+        elif link.from_node.type == "RGB" and socket.type == "RGBA":
+            value = link.from_node.outputs[0].default_value
+        else:
+            return None
+    else:
+        value = socket.default_value
+
+    if isinstance(value, float):
+        return (value, value, value, 1.0)
+    return (value[0], value[1], value[2], 1.0)
+
+
+def get_shader_constant(socket, thisbake):
+    """Returns the constant value of thisbake for the shader linked into socket, or None"""
+    if not socket.is_linked:
+        return None
+
+    node = socket.links[0].from_node
+    if node.type == "BSDF_PRINCIPLED":
+        return get_socket_constant(node.inputs[functions.psocketname[thisbake]])
+
+    if node.type == "MIX_SHADER" and not node.inputs[0].is_linked:
+        a = get_shader_constant(node.inputs[1], thisbake)
+        b = get_shader_constant(node.inputs[2], thisbake)
+        if a is None or b is None:
+            return None
+        fac = node.inputs[0].default_value
+        return tuple(x + (y - x) * fac for x, y in zip(a, b))
+
+    return None
+
+
+def get_material_constant(mat, thisbake):
+    """Returns the value of thisbake as RGBA if it is the same across the whole
+    material, otherwise None. Packed scalar bakes return one map per channel"""
+    if isinstance(thisbake, tuple):
+        values = [get_material_constant(mat, m) for m in thisbake]
+        if None in values:
+            return None
+        color = [v[0] for v in values] + [0.0] * (3 - len(values))
+        return (*color, 1.0)
+
+    if thisbake in non_constant_maps:
+        return None
+
+    # Prepared duplicates have already been rewired for another map
+    mat = get_source_material(mat)
+    if mat is None or not mat.use_nodes or not mat.node_tree:
+        return None
+
+    onode = find_output_node(mat.node_tree)
+    if not onode:
+        return None
+
+    return get_shader_constant(onode.inputs["Surface"], thisbake)
+
+
+def get_objects_constant(objects, thisbake):
+    """Returns the value of thisbake if it is the same constant on all materials
+    of the given objects, otherwise None. Objects with different constants per
+    material still need to be baked, because only the bake knows which pixels
+    belong to which material"""
+    value = None
+    for obj in objects:
+        if not obj.material_slots:
+            return None
+
+        for matslot in obj.material_slots:
+            mat_value = get_material_constant(matslot.material, thisbake)
+            if mat_value is None:
+                return None
+            if value is not None and any(abs(x - y) > 1e-6 for x, y in zip(value, mat_value)):
+                return None
+            value = mat_value
+
+    return value
+
+
+def get_socket_image(socket, uv_map, default_uv_map):
+    """Returns the image and output name of an Image Texture node linked straight
+    into socket, if it samples the image with uv_map and nothing else, otherwise None"""
+    if not socket.is_linked:
+        return None
+
+    link = socket.links[0]
+    node = link.from_node
+    if node.type != "TEX_IMAGE" or not node.image:
+        return None
+    if node.image.source not in ["FILE", "GENERATED"] or node.projection != "FLAT":
+        return None
+
+    # Without a vector input, the node samples the UV map that is active for rendering
+    vector = node.inputs["Vector"]
+    if vector.is_linked:
+        uvnode = vector.links[0].from_node
+        if uvnode.type != "UVMAP" or (uvnode.uv_map or default_uv_map) != uv_map:
+            return None
+    elif default_uv_map != uv_map:
+        return None
+
+    return (node.image, link.from_socket.name)
+
+
+def get_material_image(mat, thisbake, uv_map, default_uv_map):
+    """Returns the image and output name that thisbake copies unchanged from a material, otherwise None"""
+    if isinstance(thisbake, tuple) or thisbake in non_constant_maps:
+        return None
+
+    mat = get_source_material(mat)
+    if mat is None or not mat.use_nodes or not mat.node_tree:
+        return None
+
+    onode = find_output_node(mat.node_tree)
+    if not onode or not onode.inputs["Surface"].is_linked:
+        return None
+
+    pnode = onode.inputs["Surface"].links[0].from_node
+    if pnode.type != "BSDF_PRINCIPLED":
+        return None
+
+    return get_socket_image(pnode.inputs[functions.psocketname[thisbake]], uv_map, default_uv_map)
+
+
+def get_objects_image(objects, thisbake):
+    """Returns the image and output name if thisbake is a plain copy of the same image
+    on all materials of the given objects, otherwise None. The image has to be
+    sampled with the UV map that the objects are baked to"""
+    result = None
+    for obj in objects:
+        uv_layers = obj.data.uv_layers
+        if not obj.material_slots or not uv_layers.active:
+            return None
+
+        default_uv_map = next((uv.name for uv in uv_layers if uv.active_render), uv_layers.active.name)
+        for matslot in obj.material_slots:
+            mat_result = get_material_image(matslot.material, thisbake, uv_layers.active.name, default_uv_map)
+            if mat_result is None:
+                return None
+            if result is not None and mat_result != result:
+                return None
+            result = mat_result
+
+    return result
@@ -25,6 +25,7 @@ from . import (
 )
 
 from .bake_operation import (
+    BakedImages,
     BakeOperation,
     MasterOperation,
 )
@@ -73,27 +74,15 @@ def get_image_from_tag(thisbake, objname):
     global_mode = current_bake_op.bake_mode
     objname = functions.untrunc_if_needed(objname)
     batch_name = bpy.context.scene.TextureBake_Props.batch_name
-    results = []
+    tags = {"batch": batch_name, "globalmode": global_mode, "thisbake": thisbake}
+    results = BakedImages.find(objname, **tags)
     if current_bake_op.bake_udims:
-        results = [img for img in bpy.data.images if\
-            ("SB_objname" in img and img["SB_objname"] == objname) and\
-            ("SB_batch" in img and img["SB_batch"] == batch_name) and\
-            ("SB_globalmode" in img and img["SB_globalmode"] == global_mode) and\
-            ("SB_thisbake" in img and img["SB_thisbake"] == thisbake) and\
-            ("SB_udims" in img and img["SB_udims"])\
-        ]
-    else:
-         results = [img for img in bpy.data.images if\
-            ("SB_objname" in img and img["SB_objname"] == objname) and\
-            ("SB_batch" in img and img["SB_batch"] == batch_name) and\
-            ("SB_globalmode" in img and img["SB_globalmode"] == global_mode) and\
-            ("SB_thisbake" in img and img["SB_thisbake"] == thisbake)\
-        ]
+        results = [img for img in results if img.get("SB_udims")]
 
     if results:
         return results[0]
 
-    functions.print_msg(f"ERROR: No image with matching tag ({thisbake}) found for object {objname}");
+    functions.print_error(f"No image with matching tag ({thisbake}) found for object {objname}")
     return False
 
 
@@ -19,8 +19,6 @@
 
 import bpy
 import sys
-import subprocess
-import tempfile
 import os
 import json
 import uuid
@@ -29,12 +27,15 @@ from pathlib import Path
 from math import floor
 
 from . import (
+    bake_plan,
     bakefunctions,
     constants,
+    export_queue,
     functions,
 )
 
 from .bake_operation import (
+    BakedImages,
     BakeOperation,
     MasterOperation,
     BakeStatus,
@@ -42,8 +43,9 @@ from .bake_operation import (
 
 from .bg_bake import (
     background_bake_ops,
-    BackgroundBakeParams,
-    refresh_bake_progress,
+    get_job_blend_path,
+    remove_job_files,
+    start_background_bake,
 )
 
 
@@ -56,15 +58,8 @@ class TEXTUREBAKE_OT_bake(bpy.types.Operator):
         BakeStatus.current_map = 0
         BakeStatus.total_maps = 0
 
-        if bake_mode == constants.BAKE_MODE_PBR:
-            num_objects = len(context.selected_objects)
-            if context.scene.TextureBake_Props.use_object_list:
-                num_objects = len(context.scene.TextureBake_Props.object_list)
-            BakeStatus.total_maps = functions.get_num_maps_to_bake() * num_objects
-        elif bake_mode == constants.BAKE_MODE_S2A:
-            BakeStatus.total_maps = functions.get_num_maps_to_bake()
-
         MasterOperation.clear()
+        BakedImages.invalidate()
         MasterOperation.merged_bake = context.scene.TextureBake_Props.merged_bake
         MasterOperation.merged_bake_name = context.scene.TextureBake_Props.merged_bake_name
         MasterOperation.bake_op = BakeOperation()
@@ -72,6 +67,13 @@ class TEXTUREBAKE_OT_bake(bpy.types.Operator):
 
         bakefunctions.common_bake_prep()
 
+        # Workers of a bake pool only get a share of the objects
+        if bake_mode == constants.BAKE_MODE_PBR:
+            num_objects = len(MasterOperation.bake_op.bake_objects)
+            BakeStatus.total_maps = functions.get_num_maps_to_bake() * num_objects
+        elif bake_mode == constants.BAKE_MODE_S2A:
+            BakeStatus.total_maps = functions.get_num_maps_to_bake()
+
         if bake_mode == constants.BAKE_MODE_PBR:
             bakefunctions.do_bake()
         elif bake_mode == constants.BAKE_MODE_S2A:
@@ -82,6 +84,7 @@ class TEXTUREBAKE_OT_bake(bpy.types.Operator):
         if bake_mode == constants.BAKE_MODE_S2A:
             objects = [MasterOperation.bake_op.sb_target_object]
         bakefunctions.channel_packing(objects)
+        export_queue.wait_for_exports()
 
         bakefunctions.common_bake_finishing()
 
@@ -110,18 +113,7 @@ class TEXTUREBAKE_OT_bake(bpy.types.Operator):
         if not functions.check_scene(context.selected_objects, bake_mode):
             return {"CANCELLED"}
 
-        path = str(Path(tempfile.gettempdir()) / f"{os.getpid()}.blend")
-        bpy.ops.wm.save_as_mainfile(filepath=path, copy=True, check_existing=False)
-        process = subprocess.Popen(
-            [bpy.app.binary_path, "--background", path, "--python-expr",\
-            "import bpy; import os; from pathlib import Path;\
-            savepath=Path(bpy.data.filepath).parent / (str(os.getpid()) + \".blend\");\
-            bpy.ops.wm.save_as_mainfile(filepath=str(savepath), check_existing=False);\
-            bpy.ops.texture_bake.bake();"],
-            shell=False)
-
-        background_bake_ops.bgops_list.append(BackgroundBakeParams(process, "Export textures"))
-        bpy.app.timers.register(refresh_bake_progress)
+        start_background_bake("texture_bake.bake", "Export textures")
         self.report({"INFO"}, "Background bake process started")
 
         return {'FINISHED'}
@@ -137,21 +129,22 @@ class TEXTUREBAKE_OT_bake_input_textures(bpy.types.Operator):
         BakeStatus.current_map = 0
         BakeStatus.total_maps = 0
 
-        if bake_mode == constants.BAKE_MODE_INPUTS:
-            num_objects = len(context.selected_objects)
-            if context.scene.TextureBake_Props.use_object_list:
-                num_objects = len(context.scene.TextureBake_Props.object_list)
-            BakeStatus.total_maps = functions.get_num_input_maps_to_bake() * num_objects
-        elif bake_mode == constants.BAKE_MODE_INPUTS_S2A:
-            BakeStatus.total_maps = functions.get_num_input_maps_to_bake()
-
         MasterOperation.clear()
+        BakedImages.invalidate()
         MasterOperation.merged_bake = context.scene.TextureBake_Props.merged_bake
         MasterOperation.merged_bake_name = context.scene.TextureBake_Props.merged_bake_name
         MasterOperation.bake_op = BakeOperation()
         MasterOperation.bake_op.bake_mode = bake_mode
 
         bakefunctions.common_bake_prep()
+
+        # Workers of a bake pool only get a share of the objects
+        if bake_mode == constants.BAKE_MODE_INPUTS:
+            num_objects = len(MasterOperation.bake_op.bake_objects)
+            BakeStatus.total_maps = functions.get_num_input_maps_to_bake() * num_objects
+        elif bake_mode == constants.BAKE_MODE_INPUTS_S2A:
+            BakeStatus.total_maps = functions.get_num_input_maps_to_bake()
+
         bakefunctions.specials_bake()
         bakefunctions.common_bake_finishing()
 
@@ -178,23 +171,38 @@ class TEXTUREBAKE_OT_bake_input_textures(bpy.types.Operator):
         if not functions.check_scene(context.selected_objects, bake_mode):
             return {"CANCELLED"}
 
-        path = str(Path(tempfile.gettempdir()) / f"{os.getpid()}.blend")
-        bpy.ops.wm.save_as_mainfile(filepath=path, copy=True, check_existing=False)
-        process = subprocess.Popen(
-            [bpy.app.binary_path, "--background", path, "--python-expr",\
-            "import bpy; import os; from pathlib import Path;\
-            savepath=Path(bpy.data.filepath).parent / (str(os.getpid()) + \".blend\");\
-            bpy.ops.wm.save_as_mainfile(filepath=str(savepath), check_existing=False);\
-            bpy.ops.texture_bake.bake_input_textures();"],
-            shell=False)
-
-        background_bake_ops.bgops_list.append(BackgroundBakeParams(process, "Bake input maps"))
-        bpy.app.timers.register(refresh_bake_progress)
+        start_background_bake("texture_bake.bake_input_textures", "Bake input maps")
         self.report({"INFO"}, "Background bake process started")
 
         return {'FINISHED'}
 
 
+class TEXTUREBAKE_OT_plan_bake(bpy.types.Operator):
+    """Show what a bake with the current settings would do and estimate its time, memory and disk usage"""
+    bl_idname = "texture_bake.plan_bake"
+    bl_label = "Plan Bake"
+
+    input_maps: bpy.props.BoolProperty(
+        name = "Input Maps",
+        description = "Plan a bake of input textures instead of export textures",
+        default = False,
+    )
+
+    def execute(self, context):
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.lines = bake_plan.create_bake_plan(self.input_maps).summary()
+        for line in self.lines:
+            functions.print_msg(line)
+        return context.window_manager.invoke_props_dialog(self, width = 400)
+
+    def draw(self, context):
+        col = self.layout.column()
+        for line in self.lines:
+            col.label(text=line)
+
+
 class TEXTUREBAKE_OT_reset_aliases(bpy.types.Operator):
     """Reset the baked image name aliases"""
     bl_idname = "texture_bake.reset_aliases"
@@ -219,9 +227,9 @@ class TEXTUREBAKE_OT_bake_import(bpy.types.Operator):
     def execute(self, context):
         num_textures = 0
         while background_bake_ops.bgops_list_finished:
-            pid = background_bake_ops.bgops_list_finished[0].process.pid
-            bpy.ops.texture_bake.bake_import_individual(pnum = pid)
-            num_textures += len(functions.read_baked_textures(pid))
+            p = background_bake_ops.bgops_list_finished[0]
+            num_textures += len(p.baked_textures())
+            bpy.ops.texture_bake.bake_import_individual(job = p.uid)
         self.report({"INFO"}, f"Import complete, {num_textures} textures imported")
         return {'FINISHED'}
 
@@ -232,7 +240,7 @@ class TEXTUREBAKE_OT_bake_import_individual(bpy.types.Operator):
     bl_label = "Import baked objects previously baked in the background"
     bl_options = {'INTERNAL'}
 
-    pnum: bpy.props.IntProperty()
+    job: bpy.props.StringProperty()
 
     @classmethod
     def poll(cls, context):
@@ -240,19 +248,23 @@ class TEXTUREBAKE_OT_bake_import_individual(bpy.types.Operator):
 
     def execute(self, context):
         # Import textures and delete blend file
-        p = ([p for p in background_bake_ops.bgops_list_finished if p.process.pid == self.pnum])[0]
+        p = ([p for p in background_bake_ops.bgops_list_finished if p.uid == self.job])[0]
         background_bake_ops.bgops_list_finished.remove(p)
-        path = Path(tempfile.gettempdir()) / (str(p.process.pid) + ".blend")
-        textures = functions.read_baked_textures(p.process.pid)
+        textures = p.baked_textures()
 
-        with bpy.data.libraries.load(str(path), link=False) as (data_from, data_to):
-            data_to.images = [name for name in data_from.images if name in textures]
+        # Each job of a worker pool saved its own share of the textures
+        for job in p.jobs:
+            path = get_job_blend_path(job.uid)
+            if not path.exists():
+                continue
 
-        try:
-            path.unlink()
-            path.with_suffix(".blend1").unlink()
-        except:
-            pass
+            with bpy.data.libraries.load(str(path), link=False) as (data_from, data_to):
+                data_to.images = [name for name in data_from.images if name in job.textures]
+
+            remove_job_files(job.uid)
+
+        # The index has to pick up the imported images
+        BakedImages.invalidate()
 
         # Replace previous versions of the imported textures
         for img_id in textures:
@@ -262,7 +274,11 @@ class TEXTUREBAKE_OT_bake_import_individual(bpy.types.Operator):
                 new_img = bpy.data.images[dup_id]
                 functions.replace_image(old_img, new_img)
 
-        self.report({"INFO"}, f"Import complete, {len(textures)} textures imported")
+        errors = p.errors()
+        if errors:
+            self.report({"WARNING"}, f"Import complete, {len(textures)} textures imported, {len(errors)} errors during bake: {errors[0]}")
+        else:
+            self.report({"INFO"}, f"Import complete, {len(textures)} textures imported")
         return {'FINISHED'}
 
 
@@ -274,8 +290,8 @@ class TEXTUREBAKE_OT_bake_delete(bpy.types.Operator):
 
     def execute(self, context):
         while background_bake_ops.bgops_list_finished:
-            pid = background_bake_ops.bgops_list_finished[0].process.pid
-            bpy.ops.texture_bake.bake_delete_individual(pnum = pid)
+            uid = background_bake_ops.bgops_list_finished[0].uid
+            bpy.ops.texture_bake.bake_delete_individual(job = uid)
         return {'FINISHED'}
 
 
@@ -285,17 +301,14 @@ class TEXTUREBAKE_OT_bake_delete_individual(bpy.types.Operator):
     bl_label = "Delete the individual background bake"
     bl_options = {'INTERNAL'}
 
-    pnum: bpy.props.IntProperty()
+    job: bpy.props.StringProperty()
 
     def execute(self, context):
-        try:
-            path = Path(tempfile.gettempdir()) / (str(self.pnum) + ".blend")
-            path.unlink()
-            path.with_suffix(".blend1").unlink()
-        except:
-            pass
+        for p in [p for p in background_bake_ops.bgops_list_finished if p.uid == self.job]:
+            for job in p.jobs:
+                remove_job_files(job.uid)
 
-        background_bake_ops.bgops_list_finished = [p for p in background_bake_ops.bgops_list_finished if p.process.pid != self.pnum]
+        background_bake_ops.bgops_list_finished = [p for p in background_bake_ops.bgops_list_finished if p.uid != self.job]
         return {'FINISHED'}
 
 
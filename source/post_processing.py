@@ -18,113 +18,219 @@
 #########################################################################
 
 import bpy
-import tempfile
-import shutil
-import os
+import numpy as np
 from pathlib import Path
 
+from . import (
+    constants,
+    export_queue,
+    functions,
+)
 
-def post_process(internal_img_name, mode="3to1", save=False, **args):
-    # Import the compositing scene that we need
-    path = os.path.dirname(__file__) + "/compositing/compositing.blend\\Scene\\"
-
-    if mode == "1to1":
-        if "TBCompositing_1to1" in bpy.data.scenes:
-            bpy.data.scenes.remove(bpy.data.scenes["TBCompositing_1to1"])
-        bpy.ops.wm.append(filename="TBCompositing_1to1", directory=path)
-
-        scene = bpy.data.scenes["TBCompositing_1to1"]
-        nodes = scene.node_tree.nodes
-
-        # Set the input
-        nodes["input_img"].image = args["input_img"]
-
-        # The inverts all start muted
-        if "invert_r" in args and args["invert_r"]: nodes["invert_r"].mute = False
-        if "invert_g" in args and args["invert_g"]: nodes["invert_g"].mute = False
-        if "invert_b" in args and args["invert_b"]: nodes["invert_b"].mute = False
-        if "invert_a" in args and args["invert_a"]: nodes["invert_a"].mute = False
-        if "invert_all" in args and args["invert_all"]: nodes["invert_all"].mute=False
-
-    if mode == "3to1":
-        if "TBCompositing_3to1" in bpy.data.scenes:
-            bpy.data.scenes.remove(bpy.data.scenes["TBCompositing_3to1"])
-        bpy.ops.wm.append(filename="TBCompositing_3to1", directory=path)
-
-        scene = bpy.data.scenes["TBCompositing_3to1"]
-        node_tree = scene.node_tree
-        nodes = node_tree.nodes
-
-        # Set the inputs
-        if "input_r" in args and args["input_r"]:
-            nodes["input_r"].image = args["input_r"]
-            input_r_orig_colspace = args["input_r"].colorspace_settings.name
-            args["input_r"].colorspace_settings.name = args["space_r"]
-
-        if "input_g" in args and args["input_g"]:
-            nodes["input_g"].image = args["input_g"]
-            input_g_orig_colspace = args["input_g"].colorspace_settings.name
-            args["input_g"].colorspace_settings.name = args["space_g"]
-
-        if "input_b" in args and args["input_b"]:
-            nodes["input_b"].image = args["input_b"]
-            input_b_orig_colspace = args["input_b"].colorspace_settings.name
-            args["input_b"].colorspace_settings.name = args["space_b"]
-
-        if "input_a" in args and args["input_a"]:
-            nodes["input_a"].image = args["input_a"]
-            input_a_orig_colspace = args["input_a"].colorspace_settings.name
-            args["input_a"].colorspace_settings.name = args["space_a"]
-
-        # Clear the alpha connection unless we have an alpha texture
-        if not "input_a" in args or not args["input_a"]:
-            node_tree.links.remove(nodes["Combine RGBA"].inputs[3].links[0])
-
-        # Alpha Premul
-        if "alpha_convert" in args and args["alpha_convert"] == "straight":
-            nodes["alpha_convert"].mute = False
-            nodes["alpha_convert"].mapping = "PREMUL_TO_STRAIGHT"
-        elif "alpha_convert" in args and args["alpha_convert"] == "premul":
-            nodes["alpha_convert"].mute = False
-            nodes["alpha_convert"].mapping = "STRAIGHT_TO_PREMUL"
-
-    # Set the output resolution of the scene to the texture size we are using
-    scene.render.resolution_y = bpy.context.scene.TextureBake_Props.input_height
-    scene.render.resolution_x = bpy.context.scene.TextureBake_Props.input_width
-    scene.render.filepath = tempfile.mkdtemp()
-    scene.render.image_settings.file_format = "OPEN_EXR"
-    bpy.ops.render.render(animation=False, write_still=True, use_viewport=False, scene=scene.name)
-
-    # Reload the temp file into an internal image again
-    img = bpy.data.images.load(scene.render.filepath+"."+"exr")
+
+file_extensions = {
+    "JPEG": "jpg",
+    "OPEN_EXR": "exr",
+    "PNG": "png",
+    "TARGA": "tga",
+}
+
+
+# Maps that can be computed from another map of the same bake, by the map they
+# come from. The copy is post-processed like a baked image of its own type
+derived_maps = {
+    constants.PBR_NORMAL_DX: constants.PBR_NORMAL_OGL,
+}
+
+
+# In-place transforms for baked images by name. Each one modifies an
+# array of RGBA pixels with shape (pixels, 4)
+pixel_transforms = {}
+
+
+def pixel_transform(name):
+    """Registers a function as a pixel transform under the given name"""
+    def register(func):
+        pixel_transforms[name] = func
+        return func
+    return register
+
+
+@pixel_transform("invert_g")
+def invert_green(pixels):
+    pixels[:, 1] = 1.0 - pixels[:, 1]
+
+
+@pixel_transform("invert_rgb")
+def invert_color(pixels):
+    pixels[:, 0:3] = 1.0 - pixels[:, 0:3]
+
+
+def apply_pixel_transforms(image, transforms):
+    """Runs the named pixel transforms on the buffer of an image. The image
+    itself, its name and its tags stay the same"""
+    channels = image.channels
+    pixels = np.empty(image.size[0] * image.size[1] * channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(-1, channels)
+
+    for name in transforms:
+        pixel_transforms[name](pixels)
+
+    image.pixels.foreach_set(pixels.ravel())
+
+    # Packing again stores the modified buffer
+    image.pack()
+
+
+def read_linear_pixels(image, colorspace, size):
+    """Returns the pixels of an image as linear RGBA. Byte images are
+    decoded as if their color space was the given one"""
+    pixels = functions.get_image_pixels(image, size)
+
+    # Float buffers are always linear
+    if not image.is_float and colorspace == "sRGB":
+        pixels[:, 0:3] = functions.srgb_to_linear(pixels[:, 0:3])
+
+    return pixels
+
+
+class PackedTexture:
+    """An export texture of a preset, compiled into what channel packing needs"""
+    def __init__(self, tex):
+        self.name = tex.name
+        self.file_format = tex.file_format
+        self.depth = tex.depth
+        self.encoder = tex.encoder
+        self.compression = tex.compression
+        # Map and color space of the red, green, blue and alpha channels
+        self.channels = [(c.info, c.space) for c in [tex.red, tex.green, tex.blue, tex.alpha]]
+
+        # Determine transparency mode
+        self.alpha_convert = False
+        if self.file_format == 'PNG' or self.file_format == 'TARGA':
+            self.alpha_convert = "premul"
+
+    def pixel_key(self):
+        """Textures with the same key have the same pixels"""
+        return (tuple(self.channels), self.alpha_convert)
+
+
+def compile_pack_plan(preset):
+    """Returns the textures of an export preset as a list of PackedTexture.
+    Textures that would produce the same file are only listed once"""
+    plan = []
+    keys = set()
+    for tex in preset.textures:
+        packed = PackedTexture(tex)
+        key = (packed.name, packed.file_format, packed.depth, packed.pixel_key())
+        if key in keys:
+            functions.print_msg(f"Skipping duplicate export texture {packed.name}")
+            continue
+        keys.add(key)
+        plan.append(packed)
+    return plan
+
+
+def get_packed_pixels(inputs, spaces, alpha_convert=False):
+    """Assembles linear RGBA pixels from one channel of up to four images and returns
+    them with their size. Red, green and blue come from the same channel of their
+    input, alpha comes from the red channel of its input"""
+    # All inputs are brought to the size of the first one
+    size = next((tuple(img.size) for img in inputs if img), (
+        bpy.context.scene.TextureBake_Props.output_width,
+        bpy.context.scene.TextureBake_Props.output_height,
+    ))
+
+    # A texture that takes all color from one image is a plain copy of it
+    if inputs[0] and inputs[0] == inputs[1] == inputs[2] and spaces[0] == spaces[1] == spaces[2] and not inputs[3]:
+        pixels = read_linear_pixels(inputs[0], spaces[0], size)
+        pixels[:, 3] = 1.0
+        return size, pixels
+
+    # Missing color inputs are black, a missing alpha input is opaque
+    pixels = np.zeros((size[0] * size[1], 4), dtype=np.float32)
+    pixels[:, 3] = 1.0
+    for i, (img, space) in enumerate(zip(inputs, spaces)):
+        if img:
+            pixels[:, i] = read_linear_pixels(img, space, size)[:, i if i < 3 else 0]
+
+    # Alpha Premul
+    alpha = pixels[:, 3:4]
+    if alpha_convert == "straight":
+        np.divide(pixels[:, 0:3], alpha, out=pixels[:, 0:3], where=alpha > 0)
+    elif alpha_convert == "premul":
+        pixels[:, 0:3] *= alpha
+
+    return size, pixels
+
+
+def pack_channels(internal_img_name, save=False, **args):
+    """Assembles a texture from one channel of up to four images and stores it as a
+    packed float image. Pixels that were assembled before can be passed as a tuple
+    of size and pixels instead of the inputs"""
+    size, pixels = args.get("pixels") or get_packed_pixels(
+        [args.get(f"input_{c}") for c in "rgba"],
+        [args.get(f"space_{c}") for c in "rgba"],
+        args.get("alpha_convert"),
+    )
+
+    if internal_img_name in bpy.data.images:
+        bpy.data.images.remove(bpy.data.images[internal_img_name])
+
+    img = bpy.data.images.new(internal_img_name, size[0], size[1], alpha=True, float_buffer=True)
     img.colorspace_settings.name = "Non-Color"
-    img.name = internal_img_name
+    img.pixels.foreach_set(pixels.ravel())
     img.use_fake_user = True
     img.pack()
 
-    # Delete the external tmp file
-    shutil.rmtree(scene.render.filepath)
-
     if save:
-        scene.render.filepath = str(args["path_dir"] / args["path_filename"])
-        scene.render.image_settings.file_format = args["file_format"]
-        scene.render.image_settings.color_mode = "RGBA"
-        scene.render.image_settings.compression = 0
-        scene.render.image_settings.color_depth = args["color_depth"]
-        if args["file_format"] == "OPEN_EXR":
-            scene.render.image_settings.color_depth = "32"
-        elif args["file_format"] in ["JPEG", "TARGA"]:
-            scene.render.image_settings.color_depth = "8"
-
-        # Save
-        bpy.ops.render.render(animation=False, write_still=True, use_viewport=False, scene=scene.name)
-
-    if mode == "3to1":
-        # Restore original image color spaces
-        if "input_r" in args and args["input_r"] != None: args["input_r"].colorspace_settings.name = input_r_orig_colspace
-        if "input_g" in args and args["input_g"] != None: args["input_g"].colorspace_settings.name = input_g_orig_colspace
-        if "input_b" in args and args["input_b"] != None: args["input_b"].colorspace_settings.name = input_b_orig_colspace
-        if "input_a" in args and args["input_a"] != None: args["input_a"].colorspace_settings.name = input_a_orig_colspace
-
-    # Delete the new scene
+        path = Path(args["path_dir"]) / args["path_filename"]
+        file_format = args["file_format"]
+        depth = int(args["color_depth"])
+        compression = args.get("compression", 6)
+        if args.get("encoder") == "BUILTIN" and export_queue.can_export(file_format, depth):
+            # The pixel buffer is not used after this, the export thread can have it
+            path = Path(f"{path}.{file_extensions[file_format]}")
+            # Merged bakes pack their textures once at the end, there is no bake left to overlap with
+            props = bpy.context.scene.TextureBake_Props
+            if props.pipelined_export and not props.merged_bake:
+                export_queue.submit(pixels, size[0], size[1], path, file_format, depth, compression)
+            else:
+                export_queue.write_image(pixels, size[0], size[1], path, file_format, depth, compression)
+        else:
+            save_pixels(img, path, file_format, args["color_depth"], compression)
+
+    return img
+
+
+def save_pixels(image, path, file_format, color_depth, compression=0):
+    """Saves a linear float image to disk. All formats but EXR get the
+    standard sRGB view transform, like a render would"""
+    path = Path(f"{path}.{file_extensions[file_format]}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Saving needs the image settings and color management of a scene
+    scene = bpy.data.scenes.new("TBExport")
+    scene.display_settings.display_device = "sRGB"
+    scene.view_settings.view_transform = "Standard"
+    scene.view_settings.look = "None"
+
+    settings = scene.render.image_settings
+    settings.file_format = file_format
+    settings.color_mode = "RGB" if file_format == "JPEG" else "RGBA"
+    # Blender takes the compression level in percent
+    settings.compression = round(compression / 9 * 100)
+    settings.color_depth = color_depth
+    if file_format == "OPEN_EXR":
+        settings.color_depth = "32"
+    elif file_format in ["JPEG", "TARGA"]:
+        settings.color_depth = "8"
+
+    # The view transform only applies to color data
+    colorspace = image.colorspace_settings.name
+    image.colorspace_settings.name = "Linear"
+    image.save_render(str(path), scene=scene)
+    image.colorspace_settings.name = colorspace
+
     bpy.data.scenes.remove(scene)
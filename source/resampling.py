@@ -0,0 +1,140 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class resample_threads():
+    executor = None
+
+
+# Images with more pixels than this are resampled on several threads
+min_threaded_pixels = 1 << 20
+
+
+def box(x):
+    return ((x >= -0.5) & (x < 0.5)).astype(np.float64)
+
+
+def triangle(x):
+    return np.maximum(1.0 - np.abs(x), 0.0)
+
+
+def lanczos3(x):
+    return np.where(np.abs(x) < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+
+def mitchell(x):
+    # Mitchell-Netravali with B = C = 1/3
+    x = np.abs(x)
+    near = (7.0 * x**3 - 12.0 * x**2 + 16.0 / 3.0) / 6.0
+    far = (-7.0 / 3.0 * x**3 + 12.0 * x**2 - 20.0 * x + 32.0 / 3.0) / 6.0
+    return np.where(x < 1.0, near, np.where(x < 2.0, far, 0.0))
+
+
+# Filter kernels by name and the radius outside of which they are zero
+filters = {
+    "BOX": (box, 0.5),
+    "TRIANGLE": (triangle, 1.0),
+    "LANCZOS3": (lanczos3, 3.0),
+    "MITCHELL": (mitchell, 2.0),
+}
+
+
+def get_executor():
+    if resample_threads.executor is None:
+        resample_threads.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="TextureBakeResample")
+    return resample_threads.executor
+
+
+def get_weights(src_size, dst_size, filter_name):
+    """Returns the source indices and weights of every destination pixel, both
+    with shape (dst_size, taps). Pixels beyond the edges repeat the edge pixel"""
+    kernel, radius = filters[filter_name]
+
+    # Downscaling stretches the filter over all source pixels it covers
+    scale = src_size / dst_size
+    stretch = max(scale, 1.0)
+    taps = int(np.ceil(radius * stretch)) * 2 + 1
+
+    centers = (np.arange(dst_size) + 0.5) * scale - 0.5
+    first = np.floor(centers).astype(np.int64) - taps // 2 + 1
+    indices = first[:, None] + np.arange(taps)[None, :]
+    weights = kernel((indices - centers[:, None]) / stretch)
+
+    # Every destination pixel keeps the brightness of its source pixels
+    totals = weights.sum(axis=1, keepdims=True)
+    weights /= np.where(totals == 0.0, 1.0, totals)
+
+    return np.clip(indices, 0, src_size - 1), weights.astype(np.float32)
+
+
+def resample_axis(data, dst_size, axis, filter_name):
+    """Resamples an array of shape (height, width, channels) along one axis"""
+    indices, weights = get_weights(data.shape[axis], dst_size, filter_name)
+
+    def run(lines):
+        # lines are rows for the horizontal pass and columns for the vertical one
+        src = data[lines] if axis == 1 else data[:, lines]
+        out = np.zeros(src.shape[:axis] + (dst_size,) + src.shape[axis+1:], dtype=np.float32)
+        for t in range(indices.shape[1]):
+            if axis == 1:
+                out += src[:, indices[:, t]] * weights[None, :, t, None]
+            else:
+                out += src[indices[:, t]] * weights[:, t, None, None]
+        return out
+
+    other = 1 - axis
+    num_lines = data.shape[other]
+    num_chunks = 1
+    if data.shape[0] * data.shape[1] >= min_threaded_pixels:
+        num_chunks = min(os.cpu_count() or 1, num_lines)
+
+    if num_chunks <= 1:
+        return run(slice(None))
+
+    bounds = np.linspace(0, num_lines, num_chunks + 1).astype(int)
+    chunks = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+    results = list(get_executor().map(run, chunks))
+    return np.concatenate(results, axis=other)
+
+
+def resample(pixels, size, new_size, filter_name="LANCZOS3"):
+    """Resamples pixels of shape (width * height, channels) from size to new_size
+    with a separable filter. Pixel values are expected to be linear"""
+    width, height = size
+    new_width, new_height = new_size
+    data = pixels.reshape(height, width, -1).astype(np.float32)
+
+    if new_width != width:
+        data = resample_axis(data, new_width, 1, filter_name)
+    if new_height != height:
+        data = resample_axis(data, new_height, 0, filter_name)
+
+    return data.reshape(new_width * new_height, -1)
+
+
+def normalize_vectors(pixels):
+    """Brings the encoded normals of a normal map back to unit length. Averaging
+    neighbouring normals makes them shorter"""
+    vectors = pixels[:, 0:3] * 2.0 - 1.0
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, lengths, out=vectors, where=lengths > 0)
+    pixels[:, 0:3] = vectors * 0.5 + 0.5
@@ -59,9 +59,9 @@ class TEXTUREBAKE_PT_main(bpy.types.Panel):
                 col = row.column()
                 col.label(text=f"{p.name} - done", icon='CHECKBOX_HLT')
                 col = row.column()
-                col.operator("texture_bake.bake_import_individual", text="", icon='IMPORT').pnum = int(p.process.pid)
+                col.operator("texture_bake.bake_import_individual", text="", icon='IMPORT').job = p.uid
                 col = row.column()
-                col.operator("texture_bake.bake_delete_individual", text="", icon='TRASH').pnum = int(p.process.pid)
+                col.operator("texture_bake.bake_delete_individual", text="", icon='TRASH').job = p.uid
 
         row = box.row()
         row.operator("texture_bake.bake_import", text="Import all", icon='IMPORT')
@@ -140,6 +140,7 @@ class TEXTUREBAKE_PT_input(TextureBakeCategoryPanel, bpy.types.Panel):
         row = layout.row()
         row.scale_y = 1.5
         row.operator("texture_bake.bake_input_textures", icon='RENDER_RESULT')
+        layout.row().operator("texture_bake.plan_bake", icon='INFO').input_maps = True
 
 
 class TEXTUREBAKE_PT_bake_settings(TextureBakeCategoryPanel, bpy.types.Panel):
@@ -165,6 +166,7 @@ class TEXTUREBAKE_PT_bake_settings(TextureBakeCategoryPanel, bpy.types.Panel):
         row = layout.row()
         row.operator("texture_bake.decrease_output_res", icon = "TRIA_DOWN")
         row.operator("texture_bake.increase_output_res", icon = "TRIA_UP")
+        layout.row().prop(context.scene.TextureBake_Props, "resample_filter")
 
         layout.row().prop(context.scene.render.bake, "margin", text="Bake Margin")
 
@@ -181,6 +183,15 @@ class TEXTUREBAKE_PT_bake_settings(TextureBakeCategoryPanel, bpy.types.Panel):
         else:
             layout.row().label(text="No valid GPU device in Blender Preferences. Using CPU.")
 
+        layout.row().prop(context.scene.TextureBake_Props, "bake_workers")
+        layout.row().prop(context.scene.TextureBake_Props, "use_persistent_workers")
+
+        layout.row().prop(context.scene.TextureBake_Props, "batch_bake")
+        layout.row().prop(context.scene.TextureBake_Props, "prepare_materials_once")
+        row = layout.row()
+        row.prop(context.scene.TextureBake_Props, "bake_linked_duplicates_once")
+        row.enabled = not context.scene.TextureBake_Props.merged_bake
+        layout.row().prop(context.scene.TextureBake_Props, "pack_scalar_bakes")
         layout.row().prop(context.scene.TextureBake_Props, "merged_bake")
         row = layout.row()
         row.prop(context.scene.TextureBake_Props, "merged_bake_name")
@@ -192,6 +203,9 @@ class TEXTUREBAKE_PT_bake_settings(TextureBakeCategoryPanel, bpy.types.Panel):
         row = layout.row()
         row.prop(context.scene.TextureBake_Props, "udim_tiles")
         row.enabled = context.scene.TextureBake_Props.bake_udims
+        row = layout.row()
+        row.prop(context.scene.TextureBake_Props, "bake_udims_tiled")
+        row.enabled = context.scene.TextureBake_Props.bake_udims
 
         layout.row().prop(context.scene.TextureBake_Props, "prefer_existing_uvmap")
         layout.row().prop(context.scene.TextureBake_Props, "bake_32bit_float")
@@ -213,10 +227,12 @@ class TEXTUREBAKE_PT_export_settings(TextureBakeCategoryPanel, bpy.types.Panel):
             layout.row().prop(context.scene.TextureBake_Props, "export_folder_name")
             layout.row().prop(context.scene.TextureBake_Props, "export_folder_per_object")
             layout.row().prop(context.scene.TextureBake_Props, "export_datetime")
+            layout.row().prop(context.scene.TextureBake_Props, "pipelined_export")
 
         row = layout.row()
         row.scale_y = 1.5
         row.operator("texture_bake.bake", icon='RENDER_RESULT')
+        layout.row().operator("texture_bake.plan_bake", icon='INFO').input_maps = False
 
 
 class TEXTUREBAKE_UL_object_list(UIList):
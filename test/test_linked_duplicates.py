@@ -0,0 +1,83 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+# Runs inside Blender with the built add-on, see "make test"
+
+import addon_utils
+import bpy
+import importlib
+import sys
+import unittest
+
+
+def import_addon():
+    sys.path.insert(0, sys.argv[sys.argv.index("--") + 1])
+    addon_utils.enable("texture_bake", default_set=True)
+    return [importlib.import_module(f"texture_bake.{name}") for name in ["bakefunctions", "bake_operation", "constants", "functions"]]
+
+
+bakefunctions, bake_operation, constants, functions = import_addon()
+
+
+class TestLinkedDuplicates(unittest.TestCase):
+    def setUp(self):
+        for collection in [bpy.data.objects, bpy.data.meshes, bpy.data.images]:
+            for block in list(collection):
+                collection.remove(block)
+
+        props = bpy.context.scene.TextureBake_Props
+        props.input_width = 4
+        props.input_height = 4
+        props.bake_32bit_float = True
+
+        bake_operation.MasterOperation.clear()
+        bake_operation.BakedImages.clear()
+        op = bake_operation.BakeOperation()
+        op.bake_mode = constants.BAKE_MODE_PBR
+        op.pbr_selected_bake_types = [constants.PBR_DIFFUSE]
+        bake_operation.MasterOperation.bake_op = op
+
+        mesh = bpy.data.meshes.new("Cube")
+        self.obj = bpy.data.objects.new("Cube", mesh)
+        self.dup = bpy.data.objects.new("Cube_Dup", mesh)
+
+    def bake_image(self, batch, color):
+        bake_operation.MasterOperation.batch_name = batch
+        bpy.context.scene.TextureBake_Props.batch_name = batch
+        name = bakefunctions.create_bake_image(self.obj.name, constants.PBR_DIFFUSE)
+        functions.fill_image(bpy.data.images[name], color)
+        return name
+
+    def test_alias_ignores_older_batches(self):
+        # The older batch sorts first by name and must not be picked up
+        self.bake_image("A", (1.0, 0.0, 0.0, 1.0))
+        self.bake_image("", (0.0, 1.0, 0.0, 1.0))
+
+        bakefunctions.alias_baked_images(constants.PBR_DIFFUSE, self.obj.name, [self.dup])
+
+        images = bake_operation.BakedImages.find(self.dup.name, batch="")
+        self.assertEqual(len(images), 1)
+        pixels = functions.get_image_pixels(images[0])
+        self.assertAlmostEqual(float(pixels[:, 0].max()), 0.0, places=3)
+        self.assertAlmostEqual(float(pixels[:, 1].min()), 1.0, places=3)
+
+
+if __name__ == "__main__":
+    result = unittest.main(argv=[sys.argv[0]], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
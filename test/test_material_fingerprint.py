@@ -0,0 +1,68 @@
+#########################################################################
+#
+# Copyright (C) 2021-2022 Andreas Raddau
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+# Runs inside Blender with the built add-on, see "make test"
+
+import addon_utils
+import bpy
+import importlib
+import sys
+import unittest
+
+
+def import_addon():
+    sys.path.insert(0, sys.argv[sys.argv.index("--") + 1])
+    addon_utils.enable("texture_bake", default_set=True)
+    return importlib.import_module("texture_bake.material_analysis")
+
+
+material_analysis = import_addon()
+
+
+class TestMaterialFingerprint(unittest.TestCase):
+    def setUp(self):
+        for mat in list(bpy.data.materials):
+            bpy.data.materials.remove(mat)
+        material_analysis.clear_material_graphs()
+
+    def create_material(self, name, point_y):
+        mat = bpy.data.materials.new(name)
+        mat.use_nodes = True
+        nodes = mat.node_tree.nodes
+        bsdf = nodes["Principled BSDF"]
+        curves = nodes.new("ShaderNodeRGBCurve")
+        curves.mapping.curves[3].points.new(0.5, point_y)
+        curves.mapping.update()
+        mat.node_tree.links.new(curves.outputs["Color"], bsdf.inputs["Base Color"])
+        return mat
+
+    def test_same_curves_match(self):
+        first = self.create_material("First", 0.25)
+        second = self.create_material("Second", 0.25)
+        self.assertEqual(material_analysis.get_material_fingerprint(first), material_analysis.get_material_fingerprint(second))
+
+    def test_curve_points_differ(self):
+        first = self.create_material("First", 0.25)
+        second = self.create_material("Second", 0.75)
+        self.assertNotEqual(material_analysis.get_material_fingerprint(first), material_analysis.get_material_fingerprint(second))
+
+
+if __name__ == "__main__":
+    result = unittest.main(argv=[sys.argv[0]], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)